@@ -0,0 +1,421 @@
+# This module contains functions for benchmarking the data loading and preprocessing steps
+
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import queue
+import signal
+import subprocess
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+import data_preprocess as dp
+import instrumentation as instr
+
+# largest RKI dump (rows) that run_suite also loads at once next to the chunked path
+EAGER_MAX_ROWS = 10000000
+
+def peak_rss_mb():
+    '''
+    peak resident set size of the current process
+    :return: peak RSS in MB
+    '''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _measured(function, *args, **kwargs):
+    '''
+    calls a function and returns its wall time, the peak RSS of the process and the number of rows of the result
+    '''
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return {'wall_s': time.perf_counter() - start,
+            'peak_rss_mb': peak_rss_mb(),
+            'rows': len(result) if hasattr(result, '__len__') else None}
+
+def measure(function, *args, timeout=None, **kwargs):
+    '''
+    measures wall time and peak RSS of a function call in a fresh process, so that results of different calls
+    do not influence each other
+    :param function: function to call (must be importable, i.e. defined at module level)
+    :param timeout: seconds after which the process is killed (see run_in_process)
+    :return: dictionary with wall time [s], peak RSS [MB] and number of rows of the result
+    '''
+    return run_in_process(_measured, function, *args, timeout=timeout, **kwargs)
+
+def overview_load_eager(path):
+    '''
+    original path: load the whole RKI dump, then clean it
+    '''
+    return dp.clean_overview(pd.read_csv(path))
+
+def benchmark_overview_load(path="data/RKI/RKI_COVID19.csv", chunksize=1000000):
+    '''
+    compares wall time and peak RSS of the eager and the chunked loading path for the RKI dump
+    :param path: path to the RKI_COVID19.csv dump
+    :param chunksize: number of rows per chunk for the chunked path
+    :return: pandas dataframe with one row per loading path
+    '''
+    results = {'eager': measure(overview_load_eager, path),
+               'chunked': measure(dp.load_overview_chunked, path, chunksize=chunksize)}
+    return pd.DataFrame(results).T
+
+def date_features_legacy(overview):
+    '''
+    original date handling of clean_overview (python date objects and one DatetimeIndex per feature), kept as baseline
+    '''
+    overview['report_date'] = pd.to_datetime(overview['Meldedatum'], format='%Y/%m/%d %H:%M:%S').dt.date
+    overview['ref_date'] = pd.to_datetime(overview['Refdatum'], format='%Y/%m/%d %H:%M:%S').dt.date
+    overview['report_delay'] = (overview['report_date'] - overview['ref_date']).dt.days
+    overview['ref_date_dayofweek'] = pd.DatetimeIndex(overview['ref_date']).dayofweek
+    overview['ref_date_year'] = pd.DatetimeIndex(overview['ref_date']).year
+    overview['ref_date_week'] = pd.DatetimeIndex(overview['ref_date']).weekofyear
+    overview.loc[((overview['ref_date_year'] == 2021) & (overview['ref_date_week'] == 53)), 'ref_date_year'] = 2020
+    overview['report_date_dayofweek'] = pd.DatetimeIndex(overview['report_date']).dayofweek
+    overview['report_date_year'] = pd.DatetimeIndex(overview['report_date']).year
+    overview['report_date_week'] = pd.DatetimeIndex(overview['report_date']).weekofyear
+    overview.loc[((overview['report_date_year'] == 2021) & (overview['report_date_week'] == 53)), 'report_date_year'] = 2020
+    return overview
+
+def date_features_vectorized(overview):
+    '''
+    date handling of clean_overview via data_preprocess.date_features
+    '''
+    report = dp.date_features(overview['Meldedatum'])
+    ref = dp.date_features(overview['Refdatum'])
+    overview['report_date'] = report['date']
+    overview['ref_date'] = ref['date']
+    overview['report_delay'] = report['days'] - ref['days']
+    for prefix, features in [('ref_date', ref), ('report_date', report)]:
+        overview[f'{prefix}_dayofweek'] = features['dayofweek']
+        overview[f'{prefix}_year'] = features['year']
+        overview[f'{prefix}_week'] = features['week']
+    return overview
+
+def synthetic_dates(n, seed=0):
+    '''
+    synthetic frame with RKI-formatted report dates (2020-01-01 until 2021-01-31) and reference dates up to 30 days earlier
+    :param n: number of rows
+    :param seed: random seed
+    :return: pandas dataframe with Meldedatum and Refdatum columns
+    '''
+    rng = np.random.default_rng(seed)
+    days = pd.date_range('2019-12-01', '2021-01-31').strftime('%Y/%m/%d %H:%M:%S').values
+    report = rng.integers(31, len(days), n)
+    ref = report - rng.integers(0, 31, n)
+    return pd.DataFrame({'Meldedatum': days[report], 'Refdatum': days[ref]})
+
+def benchmark_date_features(n=10000000):
+    '''
+    compares the original and the vectorized date feature calculation on a synthetic frame
+    :param n: number of rows
+    :return: pandas series with wall time [s] per implementation
+    '''
+    dates = synthetic_dates(n)
+    results = {}
+    for name, func in [('legacy', date_features_legacy), ('vectorized', date_features_vectorized)]:
+        df = dates.copy()
+        start = time.perf_counter()
+        func(df)
+        results[name] = time.perf_counter() - start
+    return pd.Series(results, name='wall_s')
+
+def synthetic_decimals(n_rows, n_cols=60, seed=0):
+    '''
+    synthetic wide table of German decimal strings (like the incidences per age group)
+    :param n_rows: number of rows
+    :param n_cols: number of columns
+    :param seed: random seed
+    :return: pandas dataframe of strings
+    '''
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.uniform(0, 1000, (n_rows, n_cols)), 1).astype('str')
+    return pd.DataFrame(np.char.replace(values, '.', ','), columns=[f'2020_{col}' for col in range(n_cols)])
+
+def benchmark_numeric_parsing(n_rows=100000, n_cols=60):
+    '''
+    compares the original per-column conversion of German decimals with data_preprocess.parse_numeric (the synthetic
+    values repeat like those of the age tables, and parse_numeric parses every distinct string once)
+    :param n_rows: number of rows
+    :param n_cols: number of columns
+    :return: pandas series with wall time [s] per implementation
+    '''
+    table = synthetic_decimals(n_rows, n_cols)
+    results = {}
+
+    df = table.copy()
+    start = time.perf_counter()
+    for col in df.columns:
+        df[col] = df[col].str.replace(',', '.').astype('float')
+    results['per_column'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    dp.parse_numeric(table)
+    results['parse_numeric'] = time.perf_counter() - start
+    return pd.Series(results, name='wall_s')
+
+def frames_mb(frames):
+    '''
+    memory of dataframes including the python strings in object columns
+    :param frames: list of pandas dataframes
+    :return: size in MB
+    '''
+    return sum(df.memory_usage(deep=True).sum() for df in frames) / 1024 ** 2
+
+def clean_memory(mode):
+    '''
+    loads and cleans all tables with one of the ownership modes of data_clean
+    :param mode: 'deep_copy' (raw tables are copied before cleaning), 'shared' (raw tables are kept by the caller and
+    left unchanged) or 'consume' (renamed at read time and handed over to data_clean)
+    :return: dictionary with the peak RSS increase during loading and cleaning [MB], the size of the raw tables (not
+    for 'consume', as they are gone) and the size of the cleaned tables [MB]
+    '''
+    start = instr.current_rss_mb()
+    raw = None
+    if mode == 'deep_copy':
+        raw = dp.data_load()
+        tables = dp.data_clean(*[df.copy(deep=True) for df in raw])
+    elif mode == 'shared':
+        raw = dp.data_load()
+        tables = dp.data_clean(*raw)
+    else:
+        tables = dp.data_clean(*dp.data_load(rename=True), consume=True)
+    return {'peak_mb': peak_rss_mb() - start,
+            'raw_mb': frames_mb(raw) if raw is not None else None,
+            'output_mb': frames_mb(tables)}
+
+def benchmark_cleaning_memory():
+    '''
+    compares the peak memory of loading and cleaning all tables in the ownership modes of data_clean, each in a
+    fresh process
+    :return: pandas dataframe with one row per mode
+    '''
+    return pd.DataFrame({mode: run_in_process(clean_memory, mode) for mode in ['deep_copy', 'shared', 'consume']}).T
+
+def run_stage(stats, name, func, *args, **kwargs):
+    '''
+    runs a single pipeline stage and records wall time, CPU time, peak RSS increase and rows (see
+    instrumentation.run_stage)
+    :param stats: dictionary the results are added to (under name)
+    :param name: stage name
+    :param func: function of the stage
+    :return: result of the function
+    '''
+    def callback(record):
+        stats[name] = {key: value for key, value in record.items() if key != 'stage'}
+    return instr.run_stage(name, func, *args, callback=callback, **kwargs)
+
+def load_overview_pinned(path="data/RKI/RKI_COVID19.csv"):
+    '''
+    loads the whole RKI dump at once, with the same compact dtypes and columns as the chunked path
+    '''
+    return pd.read_csv(path, dtype=dict(dp.OVERVIEW_DTYPES, **dp.READ_DTYPES['overview']),
+                       usecols=lambda col: col not in dp.OVERVIEW_UNUSED)
+
+def run_stages(root, eager_overview=True, chunksize=1000000, progress=None):
+    '''
+    runs all stages of the pipeline on the data below root/data/RKI: loading and cleaning of every table, the
+    chunked and parallel loading paths, the aggregation cube and the plots; only the cleaned overview is kept across
+    stages
+    :param root: directory that takes the place of the project directory
+    :param eager_overview: also load and clean the whole RKI dump at once ('load:overview', 'clean:overview'); the
+    parallel loading path then loads it at once as well, otherwise in chunks
+    :param chunksize: number of rows per chunk of the chunked paths
+    :param progress: path of a JSON file that is updated before every stage with the statistics so far and the name
+    of the running stage (as 'failed'), so a run that is killed can still be reported
+    :return: dictionary {stage: statistics}, with the peak RSS of the whole run under 'peak_rss_mb'
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import data_cube
+    import plot_functions as pfunc
+
+    os.chdir(root)
+    os.makedirs('results', exist_ok=True)
+    stats = {}
+
+    def stage(name, func, *args, **kwargs):
+        if progress is not None:
+            with open(progress, 'w') as file:
+                json.dump(dict(stats, failed=name), file)
+        return run_stage(stats, name, func, *args, **kwargs)
+
+    # the small tables are cleaned and dropped again, only their stage statistics are kept
+    for table, (clean, sources) in dp.TABLES.items():
+        if table != 'overview':
+            raw = [stage(f'load:{source}', dp.load_source, source) for source in sources]
+            stage(f'clean:{table}', clean, *raw)
+            del raw
+    stage('load_parallel', dp.data_load_parallel, chunksize=None if eager_overview else chunksize)
+    if eager_overview:
+        stage('clean:overview', dp.clean_overview, stage('load:overview', load_overview_pinned), consume=True)
+    overview = stage('load_chunked:overview', dp.load_overview_chunked, dp.SOURCES['overview'][0],
+                     chunksize=chunksize)
+
+    cube = stage('cube:build', data_cube.build_cube, overview)
+    del overview
+    state_week = stage('cube:query_state_week', data_cube.query, cube, ['Bundesland', 'week'], where={'year': 2020})
+    district_week = data_cube.query(cube, ['Landkreis', 'week'], where={'year': 2020})
+    weekly = data_cube.query(cube, ['week'], where={'year': 2020})
+
+    for name, func, args, kwargs in [
+            ('plot:heatmap_state_week', pfunc.plot_heatmap, (state_week,), {'fmt': '.0f'}),
+            ('plot:heatmap_district_week', pfunc.plot_heatmap, (district_week,), {'fmt': '.0f', 'figsize': (15, 20)}),
+            ('plot:line_weekly', pfunc.plot_line, (weekly,), {})]:
+        fig, _ = stage(name, func, *args, filename=f'benchmark_{name[5:]}', **kwargs)
+        plt.close(fig)
+
+    stats['peak_rss_mb'] = peak_rss_mb()
+    return stats
+
+def _run_returning(function, args, kwargs, results):
+    '''
+    runs a function in a child process and sends its result (or the exception it raised) back to the parent
+    '''
+    try:
+        results.put((True, function(*args, **kwargs)))
+    except BaseException as error:
+        results.put((False, error))
+
+def run_in_process(function, *args, timeout=None, **kwargs):
+    '''
+    runs a function in a fresh process, so that its memory statistics are not influenced by earlier runs
+    :param function: function to call (must be importable, i.e. defined at module level)
+    :param timeout: seconds after which the process is killed (None: no limit)
+    :return: result of the function
+    :raises ChildProcessError: if the process died without a result, e.g. killed by the OOM killer
+    :raises TimeoutError: if the function did not return within timeout seconds
+    '''
+    context = mp.get_context('spawn')
+    results = context.Queue()
+    proc = context.Process(target=_run_returning, args=(function, args, kwargs, results))
+    start = time.perf_counter()
+    proc.start()
+    try:
+        # poll, so that a dead child does not block the parent forever
+        while True:
+            try:
+                success, result = results.get(timeout=1)
+                break
+            except queue.Empty:
+                pass
+            if not proc.is_alive():
+                # the result may have arrived right before the process exited
+                try:
+                    success, result = results.get(timeout=1)
+                    break
+                except queue.Empty:
+                    pass
+                killed = ' (killed, e.g. out of memory)' if proc.exitcode == -signal.SIGKILL else ''
+                raise ChildProcessError(f'{function.__name__} died with exit code {proc.exitcode}{killed}')
+            if timeout is not None and time.perf_counter() - start > timeout:
+                proc.kill()
+                raise TimeoutError(f'{function.__name__} did not finish within {timeout} s')
+    finally:
+        proc.join(timeout=5)
+        if proc.is_alive():
+            proc.kill()
+            proc.join()
+    if not success:
+        raise result
+    return result
+
+def environment():
+    '''
+    describes the environment of a benchmark run, so that results of different versions can be told apart
+    :return: dictionary with timestamp, git commit, python/pandas/numpy versions and number of CPUs
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'cpus': os.cpu_count()}
+
+def run_suite(sizes=(100000, 1000000), workdir="data/benchmark", output_dir="results/benchmarks", seed=0,
+              eager_max_rows=EAGER_MAX_ROWS, timeout=None):
+    '''
+    generates synthetic RKI-shaped data for every size (reused if it exists), runs all pipeline stages in a fresh
+    process per size and stores the results as JSON; a run that fails, is killed (e.g. out of memory) or times out
+    is stored with the statistics of the stages that finished, the stage that was running ('failed') and the error
+    :param sizes: numbers of rows of the RKI dump, e.g. (100000, 1000000, 10000000, 50000000)
+    :param workdir: directory for the synthetic data
+    :param output_dir: directory for the JSON results
+    :param seed: random seed of the synthetic data
+    :param eager_max_rows: largest dump that is also loaded at once (see run_stages), larger ones are only streamed
+    :param timeout: seconds after which the run of a size is killed (None: no limit)
+    :return: path of the JSON file, results dictionary
+    '''
+    import synthetic_data
+
+    results = {'environment': environment(), 'runs': {}}
+    for n_rows in sizes:
+        root = os.path.abspath(os.path.join(workdir, str(n_rows)))
+        marker = os.path.join(root, 'data', 'RKI', 'generated.json')
+        if not os.path.exists(marker):
+            synthetic_data.generate_all(root, n_rows=n_rows, seed=seed)
+            with open(marker, 'w') as file:
+                json.dump({'n_rows': n_rows, 'seed': seed}, file)
+        progress = os.path.join(root, 'progress.json')
+        if os.path.exists(progress):
+            os.remove(progress)
+        try:
+            results['runs'][str(n_rows)] = run_in_process(run_stages, root, eager_overview=n_rows <= eager_max_rows,
+                                                          progress=progress, timeout=timeout)
+        except Exception as error:
+            run = {}
+            if os.path.exists(progress):
+                with open(progress) as file:
+                    run = json.load(file)
+            run['error'] = f'{type(error).__name__}: {error}'
+            results['runs'][str(n_rows)] = run
+
+    os.makedirs(output_dir, exist_ok=True)
+    env = results['environment']
+    path = os.path.join(output_dir, f"benchmark_{env['timestamp'].replace(':', '')}_{env['commit']}.json")
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+    return path, results
+
+def compare_results(baseline, current, tolerance=0.2):
+    '''
+    compares two benchmark result files stage by stage
+    :param baseline: path of the JSON results of the reference version
+    :param current: path of the JSON results of the version to check
+    :param tolerance: relative increase of wall time or peak memory that counts as regression
+    :return: pandas dataframe per size and stage with both wall times and peak memories, their ratios and a
+    regression flag
+    '''
+    frames = []
+    for path in [baseline, current]:
+        with open(path) as file:
+            runs = json.load(file)['runs']
+        frames.append(pd.DataFrame([dict(n_rows=int(n_rows), stage=stage, **values)
+                                    for n_rows, stages in runs.items()
+                                    for stage, values in stages.items() if isinstance(values, dict)])
+                      .set_index(['n_rows', 'stage'])[['wall_s', 'peak_mb']])
+    comparison = frames[0].join(frames[1], lsuffix='_baseline', rsuffix='_current', how='inner')
+    comparison['wall_ratio'] = comparison['wall_s_current'] / comparison['wall_s_baseline']
+    # memory increases of a few MB are noise
+    comparison['peak_ratio'] = comparison['peak_mb_current'].clip(lower=10) / comparison['peak_mb_baseline'].clip(lower=10)
+    comparison['regression'] = (comparison['wall_ratio'] > 1 + tolerance) | (comparison['peak_ratio'] > 1 + tolerance)
+    return comparison
+
+if __name__ == '__main__':
+    # usage: python benchmark.py [n_rows ...]
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100000, 1000000]
+    path, results = run_suite(sizes)
+    for n_rows, stages in results['runs'].items():
+        print(f'{n_rows} rows:')
+        print(pd.DataFrame({stage: values for stage, values in stages.items() if isinstance(values, dict)}).T)
+        if 'error' in stages:
+            print(f"failed in stage {stages.get('failed')}: {stages['error']}")
+    print(f'results stored in {path}')
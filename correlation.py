@@ -0,0 +1,202 @@
+# This module contains functions for correlations between two blocks of columns (e.g. age groups vs. breakout
+# settings): only the requested cross-block is computed, NaN-aware like pandas' pairwise correlation, for one or many
+# time windows at once, and results are memoized on the hash of the input data
+
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# number of memoized results
+CACHE_SIZE = 128
+_cache = OrderedDict()
+
+def frame_hash(df):
+    '''
+    hash of the values, index and columns of a dataframe
+    :param df: pandas dataframe
+    :return: hex digest string
+    '''
+    digest = hashlib.sha1(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    digest.update(pd.util.hash_pandas_object(pd.Series(df.columns.astype('str')), index=False).values.tobytes())
+    return digest.hexdigest()
+
+def clear_cache():
+    '''
+    removes all memoized correlations
+    '''
+    _cache.clear()
+
+def rank(values, axis=-2):
+    '''
+    ranks the values along an axis (ties get their average rank, NaN stays NaN) by sorting, i.e. in O(n log n), also
+    for stacked arrays, e.g. windows x rows x columns
+    :param values: float numpy array
+    :param axis: axis to rank along (default: the rows of rows x columns arrays)
+    :return: float numpy array of ranks
+    '''
+    moved = np.moveaxis(values, axis, -1)
+    n = moved.shape[-1]
+    # NaN is sorted last and does not shift the ranks of the values
+    order = np.argsort(moved, axis=-1, kind='stable')
+    ordered = np.take_along_axis(moved, order, axis=-1)
+    positions = np.arange(n)
+    equal = ordered[..., 1:] == ordered[..., :-1]
+    # first and last sorted position of the group of equal values every value belongs to
+    is_first = np.concatenate([np.ones(moved.shape[:-1] + (1,), dtype='bool'), ~equal], axis=-1)
+    is_last = np.concatenate([~equal, np.ones(moved.shape[:-1] + (1,), dtype='bool')], axis=-1)
+    first = np.maximum.accumulate(np.where(is_first, positions, 0), axis=-1)
+    last = np.flip(np.minimum.accumulate(np.flip(np.where(is_last, positions, n), axis=-1), axis=-1), axis=-1)
+    ranks = np.empty(moved.shape)
+    np.put_along_axis(ranks, order, (first + last) / 2 + 1, axis=-1)
+    ranks[np.isnan(moved)] = np.nan
+    return np.moveaxis(ranks, -1, axis)
+
+def pair_sums(x, y):
+    '''
+    sums over all rows where both columns of a pair have values, for every pair of columns of x and y: number of
+    rows, sum of x, sum of y, sum of x^2, sum of y^2, sum of x*y
+    :param x: float numpy array rows x p (NaN for missing values)
+    :param y: float numpy array rows x q
+    :return: list of six numpy arrays p x q
+    '''
+    mx, my = (~np.isnan(x)).astype('float64'), (~np.isnan(y)).astype('float64')
+    x0, y0 = np.nan_to_num(x), np.nan_to_num(y)
+    return [mx.T @ my, x0.T @ my, mx.T @ y0, (x0 ** 2).T @ my, mx.T @ y0 ** 2, x0.T @ y0]
+
+def window_pair_sums(x, y, starts, ends):
+    '''
+    pair_sums for many row windows at once: the per-row products are summed up cumulatively once, every window is
+    then the difference of two cumulative sums
+    :param x: float numpy array rows x p (NaN for missing values)
+    :param y: float numpy array rows x q
+    :param starts: numpy array of the first row of every window
+    :param ends: numpy array of the row after the last row of every window
+    :return: list of six numpy arrays windows x p x q
+    '''
+    mx, my = (~np.isnan(x)).astype('float64'), (~np.isnan(y)).astype('float64')
+    x0, y0 = np.nan_to_num(x), np.nan_to_num(y)
+    sums = []
+    for left, right in [(mx, my), (x0, my), (mx, y0), (x0 ** 2, my), (mx, y0 ** 2), (x0, y0)]:
+        products = left[:, :, None] * right[:, None, :]
+        cumsum = np.concatenate([np.zeros((1,) + products.shape[1:]), np.cumsum(products, axis=0)])
+        sums.append(cumsum[ends] - cumsum[starts])
+    return sums
+
+def correlation_from_sums(sums, min_periods=2):
+    '''
+    Pearson correlation from the pair sums (see pair_sums)
+    :param sums: list of six numpy arrays (number, sum x, sum y, sum x^2, sum y^2, sum x*y)
+    :param min_periods: minimum number of rows with values in both columns, NaN otherwise
+    :return: numpy array of correlations
+    '''
+    n, sx, sy, sxx, syy, sxy = sums
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx ** 2 / n
+        var_y = syy - sy ** 2 / n
+        corr = np.clip(cov / np.sqrt(var_x * var_y), -1, 1)
+    return np.where((n >= min_periods) & (var_x > 0) & (var_y > 0), corr, np.nan)
+
+def spearman_corr(x, y, min_periods=2, pairwise=True):
+    '''
+    Spearman correlation between every column of x and every column of y, also for stacked arrays (e.g. windows x
+    rows x columns)
+    :param x: float numpy array (..., rows, p) (NaN for missing values)
+    :param y: float numpy array (..., rows, q)
+    :param min_periods: minimum number of rows with values in both columns, NaN otherwise
+    :param pairwise: rank every pair of columns over the rows where both have values, like pandas; otherwise every
+    column is ranked over all of its values once (cheaper, the same without missing values)
+    :return: numpy array of correlations (..., p, q)
+    '''
+    if not pairwise or not (np.isnan(x).any() or np.isnan(y).any()):
+        ranks_x, ranks_y = rank(x), rank(y)
+        mx, my = (~np.isnan(ranks_x)).astype('float64'), (~np.isnan(ranks_y)).astype('float64')
+        x0, y0 = np.nan_to_num(ranks_x), np.nan_to_num(ranks_y)
+        sums = [np.einsum('...np,...nq->...pq', left, right)
+                for left, right in [(mx, my), (x0, my), (mx, y0), (x0 ** 2, my), (mx, y0 ** 2), (x0, y0)]]
+        return correlation_from_sums(sums, min_periods)
+
+    # one ranking per pair of columns: ... x rows x p x q
+    both = ~np.isnan(x)[..., :, :, None] & ~np.isnan(y)[..., :, None, :]
+    ranks_x = np.nan_to_num(rank(np.where(both, x[..., :, :, None], np.nan), axis=-3))
+    ranks_y = np.nan_to_num(rank(np.where(both, y[..., :, None, :], np.nan), axis=-3))
+    sums = [both.sum(axis=-3).astype('float64'), ranks_x.sum(axis=-3), ranks_y.sum(axis=-3),
+            (ranks_x ** 2).sum(axis=-3), (ranks_y ** 2).sum(axis=-3), (ranks_x * ranks_y).sum(axis=-3)]
+    return correlation_from_sums(sums, min_periods)
+
+def window_bounds(index, windows):
+    '''
+    row positions of windows
+    :param index: pandas index of the rows
+    :param windows: window length in rows (all sliding windows of that length) or list of (first, last) index labels
+    :return: numpy arrays of the first row and of the row after the last row per window, pandas index of the windows
+    (first and last label)
+    '''
+    if isinstance(windows, int):
+        starts = np.arange(len(index) - windows + 1)
+        ends = starts + windows
+    else:
+        slices = [index.slice_indexer(first, last) for first, last in windows]
+        starts = np.array([window.start or 0 for window in slices])
+        ends = np.array([len(index) if window.stop is None else window.stop for window in slices])
+    labels = pd.MultiIndex.from_arrays([index[starts], index[ends - 1]], names=['start', 'end'])
+    return starts, ends, labels
+
+def cross_corr(x, y=None, method='pearson', windows=None, min_periods=2, pairwise=True):
+    '''
+    correlations between every column of x and every column of y, over all rows that have values in both columns
+    (like pandas' DataFrame.corr, but only for the x-y block); results are memoized
+    :param x: pandas dataframe with the rows to correlate over (e.g. weeks) as index
+    :param y: pandas dataframe with the same index (default: x, i.e. the full correlation matrix of x)
+    :param method: 'pearson' or 'spearman'
+    :param windows: None for all rows, a window length in rows for all sliding windows, or a list of (first, last)
+    index labels, e.g. [(23, 35)] for the summer weeks
+    :param min_periods: minimum number of rows with values in both columns, NaN otherwise
+    :param pairwise: Spearman only: rank every pair of columns over the rows where both have values, like pandas;
+    with False every column is ranked over all of its values in the window once, which is cheaper with missing values
+    :return: pandas dataframe with x columns as index and y columns as columns; with windows, the index has the first
+    and last label of each window as additional outer levels
+    '''
+    y = x if y is None else y.reindex(x.index)
+    key = (frame_hash(x), frame_hash(y), method, repr(windows), min_periods, pairwise)
+    if key in _cache:
+        _cache.move_to_end(key)
+        return _cache[key].copy()
+
+    # centered values keep the sums small, so the differences in correlation_from_sums do not lose precision
+    values_x = x.values.astype('float64')
+    values_y = y.values.astype('float64')
+    if method == 'pearson':
+        values_x = values_x - np.nanmean(values_x, axis=0)
+        values_y = values_y - np.nanmean(values_y, axis=0)
+    elif method != 'spearman':
+        raise ValueError(f'unknown method {method}')
+
+    if windows is None:
+        if method == 'spearman':
+            corr = spearman_corr(values_x, values_y, min_periods, pairwise)
+        else:
+            corr = correlation_from_sums(pair_sums(values_x, values_y), min_periods)
+        result = pd.DataFrame(corr, index=x.columns, columns=y.columns)
+    else:
+        starts, ends, labels = window_bounds(x.index, windows)
+        if method == 'pearson':
+            corr = correlation_from_sums(window_pair_sums(values_x, values_y, starts, ends), min_periods)
+        elif isinstance(windows, int):
+            # ranks differ per window: rank all sliding windows at once
+            views_x = np.lib.stride_tricks.sliding_window_view(values_x, windows, axis=0).transpose(0, 2, 1)
+            views_y = np.lib.stride_tricks.sliding_window_view(values_y, windows, axis=0).transpose(0, 2, 1)
+            corr = spearman_corr(views_x, views_y, min_periods, pairwise)
+        else:
+            # windows of different lengths
+            corr = np.stack([spearman_corr(values_x[start:end], values_y[start:end], min_periods, pairwise)
+                             for start, end in zip(starts, ends)])
+        index = pd.MultiIndex.from_tuples([window + (col,) for window in labels for col in x.columns],
+                                          names=['start', 'end', x.columns.name])
+        result = pd.DataFrame(corr.reshape(-1, len(y.columns)), index=index, columns=y.columns)
+
+    _cache[key] = result
+    if len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return result.copy()
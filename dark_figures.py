@@ -0,0 +1,97 @@
+# This module contains functions for estimating dark figures (undetected cases) from the weekly incidences per age
+# group, the relative number of social contacts per age group and the share of asymptomatic cases
+
+import numpy as np
+import pandas as pd
+
+# age groups whose incidence is taken as benchmark when it is the highest one in a week
+BENCHMARK_GROUPS = ['90+', '85 - 89', '80 - 84', '75 - 79', '70 - 74']
+
+def benchmark_incidence(age_incidence, benchmark_groups=BENCHMARK_GROUPS, total='Gesamt'):
+    '''
+    assumes the benchmark incidence for all age groups: in every week where the highest incidence is found among the
+    benchmark groups, all age groups get that incidence; other weeks are kept as they are
+    :param age_incidence: pandas dataframe with incidences per age group (index, including the total) and week (columns)
+    :param benchmark_groups: age groups that can set the benchmark
+    :param total: index label of the total incidence, which is dropped from the result
+    :return: pandas dataframe with benchmark incidences per age group and week
+    '''
+    values = age_incidence.values.astype('float')
+    weekly_max = values.max(axis=0)
+    is_benchmark = (age_incidence.loc[benchmark_groups].values == weekly_max).any(axis=0)
+    incidence_max = pd.DataFrame(np.where(is_benchmark, weekly_max, values),
+                                 index=age_incidence.index, columns=age_incidence.columns)
+    return incidence_max.drop(total, axis=0, errors='ignore')
+
+def estimate_cases(incidence_max, factors, population):
+    '''
+    estimates weekly total cases for one or many sets of social contact factors in a single matrix product
+    :param incidence_max: pandas dataframe with benchmark incidences (cases per 100.000) per age group and week
+    :param factors: relative social contacts per age group as pandas series, or pandas dataframe with one row per
+    scenario/draw and age groups as columns
+    :param population: population per age group (in 1000 units) as pandas series
+    :return: numpy array of estimated cases per week (one row per scenario/draw if factors is a dataframe)
+    '''
+    ages = incidence_max.index
+    # cases per age group and week = incidence [per 100.000] * factor * population [in 1000] / 100
+    weights = np.asarray(factors[ages] if isinstance(factors, pd.Series) else factors[ages].values) \
+        * population.reindex(ages).values / 100
+    return weights @ incidence_max.values
+
+def dark_figures(age_incidence, social_factors, population, asymptomatic=0.4, **kwargs):
+    '''
+    point estimate and 95% intervals of total cases per week, with and without additional asymptomatic cases
+    :param age_incidence: pandas dataframe with incidences per age group (index, including the total) and week (columns)
+    :param social_factors: pandas dataframe with normalized social contacts per age group (social_contacts,
+    social_contacts_95_low, social_contacts_95_high)
+    :param population: population per age group (in 1000 units) as pandas series
+    :param asymptomatic: additional share of asymptomatic cases
+    :param kwargs: further arguments for benchmark_incidence
+    :return: pandas dataframe with cases_est, cases_95_low, cases_95_high and the same with _uncertainty suffix
+    '''
+    incidence_max = benchmark_incidence(age_incidence, **kwargs)
+    scenarios = social_factors[['social_contacts', 'social_contacts_95_low', 'social_contacts_95_high']].T
+    cases = estimate_cases(incidence_max, scenarios, population)
+
+    figures = pd.DataFrame(cases.T, index=incidence_max.columns,
+                           columns=['cases_est', 'cases_95_low', 'cases_95_high'])
+    for col in ['cases_est', 'cases_95_low', 'cases_95_high']:
+        figures[f'{col}_uncertainty'] = figures[col] * (1 + asymptomatic)
+    return figures
+
+def dark_figures_monte_carlo(age_incidence, social_factors, population, n_draws=10000, asymptomatic=(0, 0.4),
+                             quantiles=(0.025, 0.5, 0.975), correlated=False, seed=None, **kwargs):
+    '''
+    Monte-Carlo estimate of total cases per week: social contact factors are drawn from normal distributions
+    matching the point estimates and 95% intervals, the asymptomatic share is drawn uniformly, and all draws are
+    evaluated in batched arrays
+    :param age_incidence: pandas dataframe with incidences per age group (index, including the total) and week (columns)
+    :param social_factors: pandas dataframe with normalized social contacts per age group (social_contacts,
+    social_contacts_95_low, social_contacts_95_high)
+    :param population: population per age group (in 1000 units) as pandas series
+    :param n_draws: number of draws
+    :param asymptomatic: range (low, high) of the additional share of asymptomatic cases
+    :param quantiles: quantiles of the estimated cases to return
+    :param correlated: use the same standard normal deviate for all age groups within a draw (like the low/high
+    scenarios) instead of independent ones
+    :param seed: random seed
+    :param kwargs: further arguments for benchmark_incidence
+    :return: pandas dataframe with mean and quantiles of estimated cases (columns) per week (index)
+    '''
+    rng = np.random.default_rng(seed)
+    incidence_max = benchmark_incidence(age_incidence, **kwargs)
+    factors = social_factors.reindex(incidence_max.index)
+
+    # standard deviation from the 95% interval
+    sigma = (factors['social_contacts_95_high'] - factors['social_contacts_95_low']).values / (2 * 1.96)
+    deviates = rng.standard_normal((n_draws, 1 if correlated else len(factors)))
+    draws = np.clip(factors['social_contacts'].values + deviates * sigma, 0, None)
+    draws = pd.DataFrame(draws, columns=factors.index)
+
+    cases = estimate_cases(incidence_max, draws, population)
+    cases *= 1 + rng.uniform(asymptomatic[0], asymptomatic[1], (n_draws, 1))
+
+    figures = pd.DataFrame(np.quantile(cases, quantiles, axis=0).T, index=incidence_max.columns,
+                           columns=[f'cases_q{q * 100:g}' for q in quantiles])
+    figures.insert(0, 'cases_mean', cases.mean(axis=0))
+    return figures
@@ -0,0 +1,182 @@
+# This module contains functions for caching the cleaned tables from data_preprocess as Arrow files, so that
+# repeated sessions do not have to parse and clean the CSV sources again
+
+import os
+import json
+import hashlib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import data_preprocess as dp
+
+# version of the cache layout; increase it when the cleaned tables change in a way the code hash does not cover
+CACHE_VERSION = 2
+
+def file_fingerprint(path, previous=None):
+    '''
+    fingerprint of a source file: size, modification time and content hash
+    :param path: path to the file
+    :param previous: fingerprint from an earlier run; its hash is reused if size and modification time are unchanged
+    :return: dictionary with size, mtime_ns and sha1
+    '''
+    stat = os.stat(path)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if previous and all(previous.get(key) == value for key, value in fingerprint.items()):
+        fingerprint['sha1'] = previous['sha1']
+        return fingerprint
+
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha1.update(block)
+    fingerprint['sha1'] = sha1.hexdigest()
+    return fingerprint
+
+def read_manifest(cache_dir):
+    '''
+    reads the source fingerprints and build information the cached tables were built from
+    :param cache_dir: cache directory
+    :return: dictionary {table: {'sources': {source: fingerprint}, 'build': build info}}
+    '''
+    path = os.path.join(cache_dir, 'manifest.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+def write_manifest(cache_dir, manifest):
+    '''
+    writes the source fingerprints and build information of the cached tables (atomically, so an interrupted run leaves no broken manifest)
+    :param cache_dir: cache directory
+    :param manifest: dictionary {table: {'sources': {source: fingerprint}, 'build': build info}}
+    '''
+    path = os.path.join(cache_dir, 'manifest.json')
+    with open(path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(path + '.tmp', path)
+
+def write_table(df, path):
+    '''
+    writes a dataframe as uncompressed Arrow (Feather v2) file, which can be memory-mapped when reading
+    :param df: pandas dataframe
+    :param path: target file path
+    '''
+    feather.write_feather(pa.Table.from_pandas(df), path + '.tmp', compression='uncompressed')
+    os.replace(path + '.tmp', path)
+
+def read_table(path):
+    '''
+    reads a cached Arrow file; the file is memory-mapped, but the conversion to pandas copies the data (column by
+    column, releasing the Arrow buffers as it goes, so the table is not held twice)
+    :param path: file path
+    :return: pandas dataframe
+    '''
+    return feather.read_table(path, memory_map=True).to_pandas(split_blocks=True, self_destruct=True)
+
+def code_hash():
+    '''
+    hash of the cleaning code, so that cached tables built by another version of it are rebuilt
+    :return: hex digest string
+    '''
+    with open(dp.__file__, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+def build_info(table, chunksize=None):
+    '''
+    describes how a table is built, besides its sources: cache version, cleaning code, pandas version and the loading
+    path of the overview (the chunked path yields compact dtypes)
+    :param table: key of the table in data_preprocess.TABLES
+    :param chunksize: chunk size the overview is loaded with (None: not chunked)
+    :return: dictionary
+    '''
+    return {'version': CACHE_VERSION,
+            'code': code_hash(),
+            'pandas': pd.__version__,
+            'chunked': bool(chunksize) and table == 'overview'}
+
+def table_fingerprints(table, manifest, cache_dir="data/cache", chunksize=None):
+    '''
+    fingerprints the sources and the build of a single table and checks them against the manifest
+    :param table: key of the table in data_preprocess.TABLES
+    :param manifest: dictionary {table: {'sources': {source: fingerprint}, 'build': build info}} (see read_manifest)
+    :param cache_dir: cache directory
+    :param chunksize: chunk size the overview is loaded with (None: not chunked)
+    :return: True if the cached table is missing or was built from sources that changed since or in another way (see
+    build_info), manifest entry of the table as it is now
+    '''
+    cached = manifest.get(table, {})
+    cached_sources = cached.get('sources', {})
+    entry = {'sources': {source: file_fingerprint(dp.SOURCES[source][0], cached_sources.get(source))
+                         for source in dp.TABLES[table][1]},
+             'build': build_info(table, chunksize)}
+    changed = any(cached_sources.get(source, {}).get('sha1') != fingerprint['sha1']
+                  for source, fingerprint in entry['sources'].items())
+    changed = changed or cached.get('build') != entry['build']
+    return changed or not os.path.exists(os.path.join(cache_dir, f'{table}.arrow')), entry
+
+def stale_tables(cache_dir="data/cache", chunksize=None):
+    '''
+    determines which cached tables are missing or were built from sources that changed since or in another way
+    :param cache_dir: cache directory
+    :param chunksize: chunk size the overview is loaded with (None: not chunked)
+    :return: list of table names to rebuild, dictionary {table: current manifest entry}
+    '''
+    manifest = read_manifest(cache_dir)
+    stale, fingerprints = [], {}
+    for table in dp.TABLES:
+        is_stale, fingerprints[table] = table_fingerprints(table, manifest, cache_dir, chunksize)
+        if is_stale:
+            stale.append(table)
+    return stale, fingerprints
+
+def load_cached_table(table, cache_dir="data/cache", chunksize=None):
+    '''
+    loads a single cleaned table from the cache, or rebuilds it from its csv sources (and writes it back) if they
+    changed or it is not cached yet
+    :param table: key of the table in data_preprocess.TABLES
+    :param cache_dir: cache directory
+    :param chunksize: if given, stream RKI_COVID19.csv in chunks of this many rows when rebuilding the overview
+    :return: cleaned pandas dataframe
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    stale, fingerprints = table_fingerprints(table, read_manifest(cache_dir), cache_dir, chunksize)
+    path = os.path.join(cache_dir, f'{table}.arrow')
+    if stale:
+        df = dp.load_table(table, chunksize=chunksize)
+        write_table(df, path)
+    else:
+        df = read_table(path)
+
+    # re-read, other tables may have been written in the meantime
+    manifest = read_manifest(cache_dir)
+    manifest[table] = fingerprints
+    write_manifest(cache_dir, manifest)
+    return df
+
+def load_cached(cache_dir="data/cache", chunksize=None):
+    '''
+    loads the cleaned tables from the cache; tables whose sources changed (or that are not cached yet) are rebuilt
+    from the csv sources and written back to the cache
+    :param cache_dir: cache directory
+    :param chunksize: if given, stream RKI_COVID19.csv in chunks of this many rows when rebuilding the overview
+    :return: cleaned pandas dataframes (same as data_clean)
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    stale, fingerprints = stale_tables(cache_dir, chunksize)
+    manifest = read_manifest(cache_dir)
+
+    tables = {}
+    for table in dp.TABLES:
+        path = os.path.join(cache_dir, f'{table}.arrow')
+        if table in stale:
+            tables[table] = dp.load_table(table, chunksize=chunksize)
+            write_table(tables[table], path)
+            manifest[table] = fingerprints[table]
+            write_manifest(cache_dir, manifest)
+        else:
+            tables[table] = read_table(path)
+            # keep refreshed modification times, so the content hash is not recomputed next time
+            manifest[table] = fingerprints[table]
+
+    write_manifest(cache_dir, manifest)
+    return tuple(tables.values())
@@ -0,0 +1,129 @@
+# This module contains functions for a pre-aggregated cube of the cleaned case overview, so that slices and
+# roll-ups (e.g. cases per federal state and week) do not need to scan every case record
+
+import numpy as np
+import pandas as pd
+
+# dimensions of the cube (Bundesland is derived from Landkreis)
+DIMENSIONS = ['year', 'week', 'Landkreis', 'Altersgruppe', 'Geschlecht']
+MEASURES = ['AnzahlFall', 'AnzahlTodesfall']
+
+def build_cube(overview):
+    '''
+    sums cases and deaths of the cleaned overview per year, calendar week, district, age group and sex, both by
+    report date and by reference date, into dense integer arrays; records without a date (NaN year/week) are left
+    out of the cube of that date
+    :param overview: cleaned overview (see data_preprocess.clean_overview)
+    :return: cube dictionary with the labels of every dimension ('labels'), the federal state code of every district
+    ('state_codes'), the federal state names ('states'), one array per date ('report', 'ref') of shape
+    (measures, year, week, Landkreis, Altersgruppe, Geschlecht) and its roll-up to federal states ('report_state',
+    'ref_state')
+    '''
+    # districts sorted by federal state, identified by (Bundesland, Landkreis) as district names are not unique
+    regions = overview[['Bundesland', 'Landkreis']].astype('str').drop_duplicates() \
+        .sort_values(['Bundesland', 'Landkreis']).reset_index(drop=True)
+    region_codes = pd.MultiIndex.from_frame(regions).get_indexer(
+        pd.MultiIndex.from_arrays([overview['Bundesland'].astype('str'), overview['Landkreis'].astype('str')]))
+    states, state_codes = np.unique(regions['Bundesland'].values, return_inverse=True)
+
+    age_codes, ages = pd.factorize(overview['Altersgruppe'].astype('str'), sort=True)
+    sex_codes, sexes = pd.factorize(overview['Geschlecht'].astype('str'), sort=True)
+    years = np.union1d(overview['report_date_year'].dropna().unique(), overview['ref_date_year'].dropna().unique()) \
+        .astype('int64')
+    weeks = np.arange(1, 54)
+
+    cube = {'labels': {'year': years,
+                       'week': weeks,
+                       'Landkreis': regions['Landkreis'].values,
+                       'Altersgruppe': np.asarray(ages),
+                       'Geschlecht': np.asarray(sexes)},
+            'state_codes': state_codes,
+            'states': states}
+    shape = (len(years), len(weeks), len(regions), len(ages), len(sexes))
+
+    for date in ['report', 'ref']:
+        year, week = overview[f'{date}_date_year'].values, overview[f'{date}_date_week'].values
+        dated = ~(pd.isna(year) | pd.isna(week))
+        year_codes = np.searchsorted(years, year[dated])
+        week_codes = week[dated].astype('int64') - 1
+        flat = np.ravel_multi_index((year_codes, week_codes, region_codes[dated], age_codes[dated], sex_codes[dated]),
+                                    shape)
+        cube[date] = np.stack([np.bincount(flat, weights=overview[measure].values[dated], minlength=np.prod(shape))
+                               .astype('int32').reshape(shape) for measure in MEASURES])
+        # pre-computed roll-up to federal states for queries that do not need districts
+        cube[f'{date}_state'] = rollup_states(cube[date], state_codes, len(states), axis=3)
+    return cube
+
+def rollup_states(values, state_codes, n_states, axis):
+    '''
+    sums the district axis of an array up to federal states
+    :param values: numpy array with a district axis
+    :param state_codes: federal state code of every district on that axis
+    :param n_states: number of federal states
+    :param axis: position of the district axis
+    :return: numpy array with the district axis replaced by a federal state axis
+    '''
+    onehot = np.zeros((len(state_codes), n_states), dtype=values.dtype)
+    onehot[np.arange(len(state_codes)), state_codes] = 1
+    return np.moveaxis(np.tensordot(np.moveaxis(values, axis, -1), onehot, axes=1), -1, axis)
+
+def query(cube, by=(), where=None, measure='AnzahlFall', date='report'):
+    '''
+    sums a measure of the cube over all dimensions not listed in by, after restricting dimensions to given values
+    :param cube: cube dictionary (see build_cube)
+    :param by: up to two dimensions to keep, out of DIMENSIONS and 'Bundesland'; two dimensions are returned as
+    dataframe (first one as index, second one as columns)
+    :param where: dictionary {dimension: value or list of values} to restrict dimensions to
+    :param measure: 'AnzahlFall' or 'AnzahlTodesfall'
+    :param date: 'report' (report date) or 'ref' (reference date)
+    :return: scalar, pandas series or pandas dataframe
+    '''
+    where = where or {}
+    if len(by) > 2:
+        raise ValueError('at most two dimensions can be kept')
+
+    # without districts involved, use the (much smaller) federal state roll-up
+    if 'Landkreis' not in by and 'Landkreis' not in where:
+        dimensions = ['Bundesland' if dim == 'Landkreis' else dim for dim in DIMENSIONS]
+        values = cube[f'{date}_state'][MEASURES.index(measure)]
+        labels = dict(cube['labels'], Bundesland=cube['states'])
+    else:
+        dimensions = DIMENSIONS
+        values = cube[date][MEASURES.index(measure)]
+        labels = dict(cube['labels'])
+    state_codes = cube['state_codes']
+
+    # restrict dimensions
+    for dim, selected in where.items():
+        selected = np.atleast_1d(selected)
+        if dim == 'Bundesland' and dim not in dimensions:
+            keep = np.isin(cube['states'][state_codes], selected)
+            dim = 'Landkreis'
+        else:
+            keep = np.isin(labels[dim], selected)
+        values = np.compress(keep, values, axis=dimensions.index(dim))
+        labels[dim] = labels[dim][keep]
+        if dim == 'Landkreis':
+            state_codes = state_codes[keep]
+
+    # sum over all other dimensions
+    kept = ['Landkreis' if dim == 'Bundesland' and dim not in dimensions else dim for dim in by]
+    values = values.sum(axis=tuple(axis for axis, dim in enumerate(dimensions) if dim not in kept))
+    remaining = [dim for dim in dimensions if dim in kept]
+
+    # roll districts up to federal states
+    if 'Bundesland' in by and 'Bundesland' not in dimensions:
+        axis = remaining.index('Landkreis')
+        used, state_index = np.unique(state_codes, return_inverse=True)
+        values = rollup_states(values, state_index, len(used), axis)
+        remaining[axis] = 'Bundesland'
+        labels['Bundesland'] = cube['states'][used]
+
+    # order axes as requested
+    values = np.transpose(values, [remaining.index(dim) for dim in by])
+    if len(by) == 0:
+        return values.item()
+    if len(by) == 1:
+        return pd.Series(values, index=pd.Index(labels[by[0]], name=by[0]), name=measure)
+    return pd.DataFrame(values, index=pd.Index(labels[by[0]], name=by[0]),
+                        columns=pd.Index(labels[by[1]], name=by[1]))
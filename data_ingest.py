@@ -0,0 +1,231 @@
+# This module contains functions for incrementally ingesting the daily RKI dashboard dumps: only rows that were
+# added or changed since the last processed dump are cleaned, and the weekly aggregates are updated in place
+
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+import data_preprocess as dp
+import data_cache as dc
+
+# raw columns that are left out of the row hash: they change with every dump without the case record itself changing,
+# or are dropped during cleaning anyway
+VOLATILE_COLUMNS = dp.OVERVIEW_UNUSED
+
+# grouping of the stored weekly aggregate (weekly cases per state and weekly totals are derived from it)
+AGGREGATE_KEYS = ['Bundesland', 'report_date_year', 'report_date_week']
+
+# layout of the incremental store (stores of an older layout are rebuilt)
+STORE_LAYOUT = 2
+
+def read_datenstand(path):
+    '''
+    reads the data status (Datenstand) of a dump from its first row only
+    :param path: path to the RKI_COVID19.csv dump
+    :return: Datenstand string
+    '''
+    return pd.read_csv(path, usecols=['Datenstand'], nrows=1)['Datenstand'].iloc[0]
+
+def row_hash(raw, key='ObjectId'):
+    '''
+    hashes the content of every raw case record, ignoring columns that change with every dump
+    :param raw: pandas dataframe of the raw dump
+    :param key: column identifying a case record
+    :return: pandas series of uint64 hashes indexed by key
+    '''
+    content = raw.drop(VOLATILE_COLUMNS, axis=1, errors='ignore')
+    return pd.Series(pd.util.hash_pandas_object(content, index=False).values, index=raw[key].values, name='row_hash')
+
+def weekly_aggregate(overview):
+    '''
+    sums cases and deaths of a cleaned overview per federal state and report week
+    :param overview: cleaned overview
+    :return: pandas dataframe with AGGREGATE_KEYS as columns and AnzahlFall, AnzahlTodesfall sums
+    '''
+    return overview.groupby(AGGREGATE_KEYS, observed=True)[['AnzahlFall', 'AnzahlTodesfall']].sum().reset_index()
+
+def update_aggregate(aggregate, added, removed):
+    '''
+    updates a weekly aggregate by the records that were added and removed
+    :param aggregate: weekly aggregate (see weekly_aggregate)
+    :param added: cleaned overview rows to add (may be empty)
+    :param removed: cleaned overview rows to subtract (may be empty)
+    :return: updated weekly aggregate
+    '''
+    parts = [aggregate] if not aggregate.empty else []
+    if len(added):
+        parts.append(weekly_aggregate(added))
+    if len(removed):
+        delta_removed = weekly_aggregate(removed)
+        delta_removed[['AnzahlFall', 'AnzahlTodesfall']] *= -1
+        parts.append(delta_removed)
+    if not parts:
+        return aggregate
+    for part in parts:
+        part['Bundesland'] = part['Bundesland'].astype('str')
+    aggregate = pd.concat(parts).groupby(AGGREGATE_KEYS)[['AnzahlFall', 'AnzahlTodesfall']].sum().reset_index()
+    # drop weeks that are empty after corrections
+    return aggregate.loc[(aggregate['AnzahlFall'] != 0) | (aggregate['AnzahlTodesfall'] != 0)].reset_index(drop=True)
+
+def weekly_cases(aggregate, year=2020):
+    '''
+    total cases per report week (without the weeks of the following year)
+    :param aggregate: weekly aggregate (see weekly_aggregate)
+    :param year: year of the analysis; report weeks of year + 1 are excluded
+    :return: pandas series of cases indexed by report_date_week
+    '''
+    return aggregate.loc[aggregate['report_date_year'] != year + 1] \
+        .groupby(['report_date_week'])['AnzahlFall'].sum()
+
+def weekly_cases_per_state(aggregate, year=2020):
+    '''
+    total cases per federal state and report week (without the weeks of the following year)
+    :param aggregate: weekly aggregate (see weekly_aggregate)
+    :param year: year of the analysis; report weeks of year + 1 are excluded
+    :return: pandas dataframe with federal states as index and report weeks as columns
+    '''
+    return aggregate.loc[aggregate['report_date_year'] != year + 1] \
+        .groupby(['Bundesland', 'report_date_week'])['AnzahlFall'].sum().unstack().fillna(0)
+
+def partition_names(overview):
+    '''
+    partition (report year and week, e.g. '2020-45') of every cleaned record
+    :param overview: cleaned overview
+    :return: pandas series of partition names
+    '''
+    return overview['report_date_year'].astype('str') + '-' + overview['report_date_week'].astype('str').str.zfill(2)
+
+def partition_path(store_dir, partition):
+    '''
+    :return: path of the Arrow file of a partition of the stored overview
+    '''
+    return os.path.join(store_dir, 'overview', f'{partition}.arrow')
+
+def read_state(store_dir):
+    '''
+    reads the row hashes (with the partition of every record), the weekly aggregate and the metadata
+    :param store_dir: directory of the incremental store
+    :return: row hashes, aggregate, metadata dictionary (None, None, {} if nothing was processed yet or the store has
+    an older layout)
+    '''
+    meta_path = os.path.join(store_dir, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None, None, {}
+    with open(meta_path) as file:
+        meta = json.load(file)
+    if meta.get('layout') != STORE_LAYOUT:
+        return None, None, {}
+    hashes = dc.read_table(os.path.join(store_dir, 'hashes.arrow'))
+    aggregate = dc.read_table(os.path.join(store_dir, 'aggregate.arrow'))
+    return hashes, aggregate, meta
+
+def write_state(store_dir, hashes, aggregate, meta):
+    '''
+    writes the row hashes, the weekly aggregate and the metadata (the overview partitions are written by ingest)
+    :param store_dir: directory of the incremental store
+    :param hashes: row hashes and partitions indexed by record key
+    :param aggregate: weekly aggregate
+    :param meta: metadata dictionary
+    '''
+    os.makedirs(store_dir, exist_ok=True)
+    dc.write_table(hashes, os.path.join(store_dir, 'hashes.arrow'))
+    dc.write_table(aggregate, os.path.join(store_dir, 'aggregate.arrow'))
+    # metadata last: it marks the state as complete
+    with open(os.path.join(store_dir, 'meta.json'), 'w') as file:
+        json.dump(dict(meta, layout=STORE_LAYOUT), file, indent=2)
+
+def read_overview(store_dir="data/incremental", partitions=None):
+    '''
+    reads the stored cleaned overview
+    :param store_dir: directory of the incremental store
+    :param partitions: list of partitions (report weeks, e.g. ['2020-45', '2020-46']) to read, None for all
+    :return: cleaned overview indexed by record key
+    '''
+    if partitions is None:
+        directory = os.path.join(store_dir, 'overview')
+        partitions = sorted(name[:-len('.arrow')] for name in os.listdir(directory) if name.endswith('.arrow'))
+    frames = [dc.read_table(partition_path(store_dir, partition)) for partition in partitions
+              if os.path.exists(partition_path(store_dir, partition))]
+    return dp.concat_categorical(frames) if len(frames) > 1 else frames[0] if frames else pd.DataFrame()
+
+def ingest(path=dp.SOURCES['overview'][0], store_dir="data/incremental", key='ObjectId', chunksize=1000000):
+    '''
+    ingests a new RKI dump: the dump is hashed chunk by chunk, records that are new or whose content changed are
+    cleaned and replace their previous version, records that no longer exist are dropped, and the weekly aggregate is
+    updated by the difference only; the cleaned overview is stored partitioned by report week, and only partitions
+    with changed records are rewritten
+    :param path: path to the RKI_COVID19.csv dump
+    :param store_dir: directory of the incremental store
+    :param key: column identifying a case record
+    :param chunksize: number of rows per chunk
+    :return: weekly aggregate, dictionary with the numbers of added, changed and removed records (the cleaned overview
+    can be read with read_overview)
+    '''
+    hashes, aggregate, meta = read_state(store_dir)
+    datenstand = read_datenstand(path)
+    if hashes is not None and meta.get('Datenstand') == datenstand:
+        return aggregate, {'added': 0, 'changed': 0, 'removed': 0}
+    if hashes is None:
+        # new store (or older layout): start from scratch
+        shutil.rmtree(os.path.join(store_dir, 'overview'), ignore_errors=True)
+        if os.path.exists(os.path.join(store_dir, 'overview.arrow')):
+            os.remove(os.path.join(store_dir, 'overview.arrow'))
+        hashes = pd.DataFrame({'row_hash': pd.Series(dtype='uint64'), 'partition': pd.Series(dtype='str')},
+                              index=pd.Index([], name=key))
+        aggregate = pd.DataFrame(columns=AGGREGATE_KEYS + ['AnzahlFall', 'AnzahlTodesfall'])
+
+    # hash chunk by chunk, clean only added and changed records
+    reader = pd.read_csv(path, chunksize=chunksize, dtype=dp.OVERVIEW_DTYPES,
+                         usecols=lambda col: col == key or col not in VOLATILE_COLUMNS)
+    seen, changed, cleaned = [], [], []
+    n_added = 0
+    for chunk in reader:
+        chunk_hashes = row_hash(chunk, key=key)
+        seen.append(chunk_hashes.index.values)
+        positions = hashes.index.get_indexer(chunk_hashes.index)
+        todo = positions < 0
+        n_added += todo.sum()
+        is_changed = hashes['row_hash'].values[positions[~todo]] != chunk_hashes.values[~todo]
+        changed.append(chunk_hashes.index.values[~todo][is_changed])
+        todo[~todo] = is_changed
+        if todo.any():
+            part = dp.clean_overview(chunk.loc[todo].copy(), consume=True)
+            part.index = pd.Index(chunk_hashes.index.values[todo], name=key)
+            part['row_hash'] = chunk_hashes.values[todo]
+            cleaned.append(part)
+
+    changed_ids = pd.Index(np.concatenate(changed) if changed else [], name=key)
+    removed_ids = hashes.index.difference(np.concatenate(seen) if seen else [])
+    outdated_ids = changed_ids.union(removed_ids)
+    cleaned = dp.concat_categorical(cleaned) if len(cleaned) > 1 else cleaned[0] if cleaned else pd.DataFrame()
+    new_partitions = partition_names(cleaned) if len(cleaned) else pd.Series(dtype='str')
+
+    # rewrite only the partitions that lose outdated records or get new ones
+    affected = set(hashes.loc[outdated_ids, 'partition']) | set(new_partitions)
+    outdated = []
+    os.makedirs(os.path.join(store_dir, 'overview'), exist_ok=True)
+    for partition in sorted(affected):
+        frames = [cleaned.loc[(new_partitions == partition).values].drop('row_hash', axis=1)] if len(cleaned) else []
+        if os.path.exists(partition_path(store_dir, partition)):
+            stored = dc.read_table(partition_path(store_dir, partition))
+            is_outdated = stored.index.isin(outdated_ids)
+            outdated.append(stored.loc[is_outdated].copy())
+            frames.insert(0, stored.drop(stored.index[is_outdated]))
+        frames = [frame for frame in frames if len(frame)]
+        if frames:
+            dc.write_table(dp.concat_categorical(frames) if len(frames) > 1 else frames[0],
+                           partition_path(store_dir, partition))
+        elif os.path.exists(partition_path(store_dir, partition)):
+            os.remove(partition_path(store_dir, partition))
+
+    outdated = dp.concat_categorical(outdated) if len(outdated) > 1 else outdated[0] if outdated else pd.DataFrame()
+    aggregate = update_aggregate(aggregate, cleaned, outdated)
+    new_hashes = pd.DataFrame({'row_hash': cleaned['row_hash'].values if len(cleaned) else [],
+                               'partition': new_partitions.values}, index=pd.Index(cleaned.index, name=key))
+    hashes = pd.concat([hashes.drop(outdated_ids), new_hashes.astype({'row_hash': 'uint64'})])
+    hashes['partition'] = hashes['partition'].astype('str')
+
+    write_state(store_dir, hashes, aggregate, {'Datenstand': datenstand, 'rows': len(hashes)})
+    stats = {'added': int(n_added), 'changed': len(changed_ids), 'removed': len(removed_ids)}
+    return aggregate, stats
@@ -0,0 +1,127 @@
+# This module contains functions for aggregating archives of RKI dashboard dumps that do not fit into memory: the
+# dumps are split into partitions per data status (Datenstand) and federal state on disk, every partition is cleaned
+# and aggregated on its own in a process pool, and the partial sums are merged
+
+import os
+import re
+import glob
+import json
+import shutil
+import tempfile
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+import data_preprocess as dp
+import data_cache as dc
+
+# default grouping of the aggregate (Datenstand is always added): reported cases per reference date and reporting
+# delay, i.e. how the cases of a day were reported over time, per snapshot
+PARTITION_KEYS = ['Bundesland', 'ref_date', 'report_delay']
+PARTITION_MEASURES = ['AnzahlFall', 'AnzahlTodesfall']
+
+# raw columns that are not needed for the aggregation (Datenstand is kept to partition by)
+PARTITION_UNUSED = [col for col in dp.OVERVIEW_UNUSED if col != 'Datenstand']
+
+def partition_name(datenstand, state_id):
+    '''
+    directory name of a partition
+    :param datenstand: data status string, e.g. '28.01.2021, 00:00 Uhr'
+    :param state_id: federal state id (IdBundesland)
+    :return: directory name, e.g. '28_01_2021_00_00_Uhr/8'
+    '''
+    return os.path.join(re.sub(r'\W+', '_', str(datenstand)).strip('_'), str(state_id))
+
+def partition_dump(path, partition_dir, part_id=0, chunksize=1000000):
+    '''
+    streams a dump in chunks and appends the rows of every data status and federal state as Arrow part files to the
+    directory of their partition, so only one chunk is in memory at a time
+    :param path: path to a RKI_COVID19.csv dump (may contain several data statuses)
+    :param partition_dir: root directory of the partitions
+    :param part_id: identifier of the dump, keeps the part file names of different dumps apart
+    :param chunksize: number of rows per chunk
+    :return: list of the partition directories written to
+    '''
+    reader = pd.read_csv(path, chunksize=chunksize, dtype=dict(dp.OVERVIEW_DTYPES, Datenstand='category'),
+                         usecols=lambda col: col not in PARTITION_UNUSED)
+    partitions = set()
+    for number, chunk in enumerate(reader):
+        for (datenstand, state_id), rows in chunk.groupby(['Datenstand', 'IdBundesland'], observed=True):
+            directory = os.path.join(partition_dir, partition_name(datenstand, state_id))
+            os.makedirs(directory, exist_ok=True)
+            dc.write_table(rows.reset_index(drop=True), os.path.join(directory, f'part-{part_id}-{number}.arrow'))
+            partitions.add(directory)
+    return sorted(partitions)
+
+def aggregate_partition(directory, keys=PARTITION_KEYS, measures=PARTITION_MEASURES):
+    '''
+    cleans the rows of a single partition and sums the measures per key
+    :param directory: partition directory (see partition_dump)
+    :param keys: columns of the cleaned overview to group by
+    :param measures: columns of the cleaned overview to sum
+    :return: pandas dataframe with Datenstand, keys and measures as columns
+    '''
+    parts = [dc.read_table(path) for path in sorted(glob.glob(os.path.join(directory, '*.arrow')))]
+    overview = dp.concat_categorical(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    del parts
+    datenstand = str(overview['Datenstand'].iloc[0])
+
+    overview = dp.clean_overview(overview, consume=True)
+    aggregate = overview.groupby(keys, observed=True)[measures].sum().reset_index()
+    aggregate.insert(0, 'Datenstand', datenstand)
+    return aggregate
+
+def merge_aggregates(aggregates, keys=PARTITION_KEYS, measures=PARTITION_MEASURES):
+    '''
+    merges partial aggregates by summing the measures of equal keys (e.g. when keys do not contain Bundesland)
+    :param aggregates: list of pandas dataframes (see aggregate_partition)
+    :param keys: columns the partial aggregates are grouped by
+    :param measures: summed columns
+    :return: pandas dataframe with Datenstand (as datetime), keys and measures as columns
+    '''
+    aggregates = [aggregate.astype({col: 'str' for col in aggregate.select_dtypes('category').columns})
+                  for aggregate in aggregates]
+    merged = pd.concat(aggregates, ignore_index=True).groupby(['Datenstand'] + keys)[measures].sum().reset_index()
+    merged['Datenstand'] = pd.to_datetime(merged['Datenstand'], format='%d.%m.%Y, %H:%M Uhr')
+    return merged.sort_values(['Datenstand'] + keys, ignore_index=True)
+
+def aggregate_out_of_core(paths, partition_dir=None, keys=PARTITION_KEYS, measures=PARTITION_MEASURES,
+                          chunksize=1000000, max_workers=None, keep_partitions=False):
+    '''
+    aggregates the cleaned overview of many dumps (e.g. the archive of daily snapshots) without ever holding more
+    than one chunk or partition per worker in memory: the dumps are partitioned by data status and federal state in
+    parallel, then every partition is cleaned and aggregated in a process pool and the partial sums are merged
+    :param paths: list of paths to RKI_COVID19.csv dumps
+    :param partition_dir: directory for the partitions: None for a new temporary directory; a directory that does not
+    exist yet is created, inside an existing one a new subdirectory is created (existing files are never touched)
+    :param keys: columns of the cleaned overview to group by (Datenstand is always added)
+    :param measures: columns of the cleaned overview to sum
+    :param chunksize: number of rows per chunk when partitioning
+    :param max_workers: number of worker processes (default: number of CPUs)
+    :param keep_partitions: keep the partitions, e.g. to aggregate them by other keys with aggregate_partition (their
+    directory is given as attrs['partition_dir'] of the result); otherwise the directory created for them is removed
+    :return: pandas dataframe with Datenstand, keys and measures as columns
+    '''
+    if partition_dir is None:
+        partition_dir = tempfile.mkdtemp(prefix='partitions_')
+    elif not os.path.exists(partition_dir):
+        os.makedirs(partition_dir)
+    else:
+        partition_dir = tempfile.mkdtemp(prefix='partitions_', dir=partition_dir)
+
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            written = pool.map(partition_dump, paths, [partition_dir] * len(paths), range(len(paths)),
+                               [chunksize] * len(paths))
+            partitions = sorted(set(directory for directories in written for directory in directories))
+            aggregates = list(pool.map(aggregate_partition, partitions, [keys] * len(partitions),
+                                       [measures] * len(partitions)))
+    finally:
+        # only the directory created above is removed
+        if not keep_partitions:
+            shutil.rmtree(partition_dir, ignore_errors=True)
+
+    merged = merge_aggregates(aggregates, keys=keys, measures=measures)
+    if keep_partitions:
+        with open(os.path.join(partition_dir, 'partitions.json'), 'w') as file:
+            json.dump({'paths': list(paths), 'partitions': partitions}, file, indent=2)
+        merged.attrs['partition_dir'] = partition_dir
+    return merged
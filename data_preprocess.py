@@ -2,223 +2,569 @@
 # CSV tables with Coronavirus data for general analysis
 
 import pandas as pd
+import numpy as np
 import math
+import os
+import time
 import functools as func
+import instrumentation as instr
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from pandas.api.types import union_categoricals
+
+# compact dtypes for the columns of the RKI dashboard dump (columns not listed are parsed as usual)
+OVERVIEW_DTYPES = {'IdBundesland': 'int8',
+                   'Bundesland': 'category',
+                   'Landkreis': 'category',
+                   'Altersgruppe': 'category',
+                   'Geschlecht': 'category',
+                   'AnzahlFall': 'int32',
+                   'AnzahlTodesfall': 'int32',
+                   'IdLandkreis': 'int32',
+                   'NeuerFall': 'int8',
+                   'NeuerTodesfall': 'int8',
+                   'NeuGenesen': 'int8',
+                   'AnzahlGenesen': 'int32',
+                   'IstErkrankungsbeginn': 'int8'}
+
+# columns of the RKI dashboard dump that are dropped during cleaning, by every loading path (FID and ObjectId are
+# record ids that change with every dump)
+OVERVIEW_UNUSED = ['Altersgruppe2', 'Datenstand', 'ObjectId', 'FID']
+
+# raw csv sources in the "data" directory: file path and read_csv arguments (German decimals are parsed right away
+# where a file has no other placeholders; the cleaning functions accept both parsed and string columns)
+SOURCES = {'overview': ("data/RKI/RKI_COVID19.csv", {}),
+           'casting': ("data/RKI/Nowcasting_Zahlen_csv.csv", {'sep': ';', 'decimal': ',', 'na_values': ['.']}),
+           'breakouts': ("data/RKI/Ausbruchsdaten.csv", {'sep': ';'}),
+           'cases_age1': ("data/RKI/Altersverteilung_total.csv", {'sep': ';'}),
+           'cases_age2': ("data/RKI/Altersverteilung_incidence.csv", {'sep': ';', 'decimal': ','}),
+           'deaths1': ("data/RKI/COVID-19_Todesfaelle_all.csv", {'sep': ';'}),
+           'deaths2': ("data/RKI/COVID-19_Todesfaelle_age.csv", {'sep': ';'}),
+           'deaths3': ("data/RKI/COVID-19_Todesfaelle_gender.csv", {'sep': ';'}),
+           'tests1': ("data/RKI/Testzahlen-gesamt.csv", {'sep': ';'}),
+           'tests2': ("data/RKI/Testzahlen-rueck.csv", {'sep': ';'}),
+           'comorb': ("data/RKI/Klinische_Aspekte.csv", {'sep': ';', 'skiprows': 2, 'decimal': ','})}
+
+# columns of the raw sources that are renamed during cleaning, None for columns that are dropped (load_source can
+# apply this at read time already, so the cleaning functions do not need to copy the tables for it)
+COLUMN_NAMES = {'overview': dict.fromkeys(OVERVIEW_UNUSED),
+                'casting': {'Datum': 'date',
+                            'Schätzer_Neuerkrankungen': 'est_new_cases',
+                            'UG_PI_Neuerkrankungen': 'pred_lower',
+                            'OG_PI_Neuerkrankungen': 'pred_upper',
+                            'Schätzer_Neuerkrankungen_ma4': 'est_new_cases_smooth',
+                            'UG_PI_Neuerkrankungen_ma4': 'pred_lower_smooth',
+                            'OG_PI_Neuerkrankungen_ma4': 'pred_upper_smooth',
+                            'Schätzer_Reproduktionszahl_R': 'est_r',
+                            'UG_PI_Reproduktionszahl_R': 'r_lower',
+                            'OG_PI_Reproduktionszahl_R': 'r_upper',
+                            'Schätzer_7_Tage_R_Wert': 'est_r7',
+                            'UG_PI_7_Tage_R_Wert': 'r7_upper',
+                            'OG_PI_7_Tage_R_Wert': 'r7_lower'},
+                'breakouts': {'sett_f': None,
+                              'Meldewoche': 'week',
+                              'n': 'num_breakouts'},
+                'deaths1': {'Sterbejahr': None,
+                            'Sterbewoche': 'week',
+                            'Anzahl verstorbene COVID-19 Fälle': 'deaths_total'},
+                'deaths2': {'Sterbjahr': None,
+                            'Sterbewoche': 'week',
+                            'AG 0-9 Jahre': 'age_0',
+                            'AG 10-19 Jahre': 'age_10',
+                            'AG 20-29 Jahre': 'age_20',
+                            'AG 30-39 Jahre': 'age_30',
+                            'AG 40-49 Jahre': 'age_40',
+                            'AG 50-59 Jahre': 'age_50',
+                            'AG 60-69 Jahre': 'age_60',
+                            'AG 70-79 Jahre': 'age_70',
+                            'AG 80-89 Jahre': 'age_80',
+                            'AG 90+ Jahre': 'age_90'},
+                'deaths3': {'Sterbjahr': None,
+                            'Sterbewoche': 'week',
+                            'Männer, AG 0-19 Jahre': 'M0_19',
+                            'Männer, AG 20-39 Jahre': 'M20_39',
+                            'Männer, AG 40-59 Jahre': 'M40_59',
+                            'Männer, AG 60-79 Jahre': 'M60_79',
+                            'Männer, AG 80+ Jahre': 'M80',
+                            'Frauen, AG 0-19 Jahre': 'F0_19',
+                            'Frauen, AG 20-39 Jahre': 'F20_39',
+                            'Frauen, AG 40-59 Jahre': 'F40_59',
+                            'Frauen, AG 60-79 Jahre': 'F60_79',
+                            'Frauen, AG 80+ Jahre': 'F80'},
+                'tests1': {'KW, für die die Angabe prognostisch erfolgt ist:': 'week',
+                           'Anzahl übermittelnde Labore': 'laboratories',
+                           'Testkapazität pro Tag': 'daily_cap',
+                           'Theoretische wöchentliche Kapazität anhand von Wochenarbeitstagen': 'weekly_cap_est',
+                           'Reale Testkapazität zum Zeitpunkt der Abfrage': 'weekly_cap_real'},
+                'tests2': {'Unnamed: 3': None,
+                           'Labore mit Rückstau': 'laboratories_tailback',
+                           'KW': 'week',
+                           'Probenrückstau': 'tests_tailback'},
+                'comorb': {'Unnamed: 0': None,
+                           'Meldejahr': 'year',
+                           'MW': 'week',
+                           'Fälle gesamt': 'cases_tot',
+                           'Mittelwert Alter (Jahre)': 'mean_age',
+                           'Männer': 'male_perc',
+                           'Frauen': 'female_perc',
+                           'Anzahl mit Angaben zu Symptomen': 'symptoms_reported',
+                           'Anteil keine, bzw. keine für COVID-19 bedeutsamen Symptome': 'no_symptoms_perc',
+                           'Anzahl mit Angaben zur Hospitalisierung': 'hospital_reported',
+                           'Anzahl hospitalisiert': 'hospital_num',
+                           'Anteil hospitalisiert': 'hospital_perc',
+                           'Anzahl Verstorben': 'deaths_num',
+                           'Anteil Verstorben': 'deaths_perc'}}
+
+# dtypes applied at read time together with the renaming: the report and reference dates repeat a few hundred
+# distinct strings over millions of rows and are only parsed during cleaning
+READ_DTYPES = {'overview': {'Meldedatum': 'category', 'Refdatum': 'category'}}
+
+def load_source(name, rename=False):
+    '''
+    loads a single raw csv source as dataframe
+    :param name: key of the source in SOURCES
+    :param rename: skip unused columns while parsing and rename the others right away (see COLUMN_NAMES), without
+    copying the table, and read columns that are converted during cleaning with compact dtypes (see READ_DTYPES); the
+    cleaning functions accept both raw and renamed tables
+    :return: pandas dataframe of the raw extracted data
+    '''
+    path, kwargs = SOURCES[name]
+    if not rename:
+        return pd.read_csv(path, **kwargs)
+
+    names = COLUMN_NAMES.get(name, {})
+    df = pd.read_csv(path, usecols=lambda col: names.get(col, col) is not None, dtype=READ_DTYPES.get(name), **kwargs)
+    df.rename(columns=names, inplace=True)
+    return df
+
+def select_columns(df, source):
+    '''
+    drops the unused columns of a raw source and renames the others (see COLUMN_NAMES); columns that were dropped or
+    renamed at read time already are skipped, and the data itself is not copied for renaming
+    :param df: pandas dataframe of a raw source
+    :param source: key of the source in COLUMN_NAMES
+    :return: pandas dataframe with the cleaned column names (sharing its data with df)
+    '''
+    names = COLUMN_NAMES[source]
+    unused = [col for col, new in names.items() if new is None and col in df.columns]
+    if unused:
+        df = df.drop(unused, axis=1)
+    return df.rename(columns={col: new for col, new in names.items() if new is not None}, copy=False)
+
+def concat_categorical(frames, **kwargs):
+    '''
+    concatenates dataframes with categorical columns without falling back to object columns when the categories of
+    the single frames differ
+    :param frames: list of pandas dataframes with the same columns
+    :param kwargs: further arguments for pd.concat
+    :return: concatenated pandas dataframe
+    '''
+    # unify categories across frames, otherwise concat falls back to object columns
+    for col in frames[0].select_dtypes('category').columns:
+        categories = union_categoricals([frame[col] for frame in frames], ignore_order=True).categories
+        for frame in frames:
+            frame[col] = frame[col].cat.set_categories(categories)
+
+    return pd.concat(frames, **kwargs)
+
+def load_overview_chunked(path="data/RKI/RKI_COVID19.csv", chunksize=1000000):
+    '''
+    streams the general covid case overview (RKI dashboard data) in chunks with compact dtypes and cleans each chunk
+    right away, so the raw string table never sits in memory as a whole
+    :param path: path to the RKI_COVID19.csv dump
+    :param chunksize: number of rows per chunk
+    :return: cleaned pandas dataframe (same as clean_overview on the fully loaded table)
+    '''
+    reader = pd.read_csv(path, chunksize=chunksize, dtype=OVERVIEW_DTYPES,
+                         usecols=lambda col: col not in OVERVIEW_UNUSED)
+    chunks = [clean_overview(chunk, consume=True) for chunk in reader]
+    if not chunks:
+        return pd.DataFrame()
+
+    return concat_categorical(chunks, ignore_index=True)
 
-def data_load():
+def data_load(chunksize=None, rename=False, callback=None, profile=None, trace=None):
     '''
     loads data as dataframe from different csv sources in the "data" directory
+    :param chunksize: if given, stream RKI_COVID19.csv in chunks of this many rows with compact dtypes; the returned
+    overview is then already cleaned (data_clean leaves it untouched)
+    :param rename: skip unused columns and rename the others at read time (see load_source)
+    :param callback: optional function that gets a record with wall/CPU time, memory and rows per loaded source
+    ('load:<source>', see instrumentation.run_stage)
+    :param profile: stage name(s) to run under cProfile
+    :param trace: stage name(s) to run with tracemalloc
     :return: pandas dataframes of the raw extracted data
     '''
+    stage = func.partial(instr.run_stage, callback=callback, profile=profile, trace=trace)
+    load = func.partial(load_source, rename=rename)
 
     #### general covid case overview (RKI dashboard data)
-    overview = pd.read_csv("data/RKI/RKI_COVID19.csv")
+    if chunksize:
+        overview = stage('load:overview', load_overview_chunked, SOURCES['overview'][0], chunksize=chunksize)
+    else:
+        overview = stage('load:overview', load, 'overview')
 
     #### reproductive factor calculation from RKI nowcasting
-    casting = pd.read_csv("data/RKI/Nowcasting_Zahlen_csv.csv", sep=';')
+    casting = stage('load:casting', load, 'casting')
 
     #### cases which were be counted as a breakout
-    breakouts = pd.read_csv("data/RKI/Ausbruchsdaten.csv", sep=';')
+    breakouts = stage('load:breakouts', load, 'breakouts')
 
     #### cases per age
-    cases_age1 = pd.read_csv("data/RKI/Altersverteilung_total.csv", sep=';')
-    cases_age2 = pd.read_csv("data/RKI/Altersverteilung_incidence.csv", sep=';')
+    cases_age1 = stage('load:cases_age1', load, 'cases_age1')
+    cases_age2 = stage('load:cases_age2', load, 'cases_age2')
 
     #### deaths
-    deaths1 = pd.read_csv("data/RKI/COVID-19_Todesfaelle_all.csv", sep=';')
-    deaths2 = pd.read_csv("data/RKI/COVID-19_Todesfaelle_age.csv", sep=';')
-    deaths3 = pd.read_csv("data/RKI/COVID-19_Todesfaelle_gender.csv", sep=';')
+    deaths1 = stage('load:deaths1', load, 'deaths1')
+    deaths2 = stage('load:deaths2', load, 'deaths2')
+    deaths3 = stage('load:deaths3', load, 'deaths3')
 
     #### PRC test capacities
-    tests1 = pd.read_csv("data/RKI/Testzahlen-gesamt.csv", sep=';')
-    tests2 = pd.read_csv("data/RKI/Testzahlen-rueck.csv", sep=';')
+    tests1 = stage('load:tests1', load, 'tests1')
+    tests2 = stage('load:tests2', load, 'tests2')
 
     #### comorbidities
-    comorb = pd.read_csv("data/RKI/Klinische_Aspekte.csv", sep=';', skiprows=2)
+    comorb = stage('load:comorb', load, 'comorb')
 
     return overview, casting, breakouts, cases_age1, cases_age2, deaths1, deaths2, deaths3, tests1, tests2, comorb
 
-def data_clean(overview, casting, breakouts, cases_age1, cases_age2, deaths1, deaths2, deaths3, tests1, tests2, clinical):
+def parse_numeric(df, columns=None, decimal=',', thousands=None, sentinels=None):
     '''
-    takes pandas dataframes of the raw extracted data and preprocesses, cleans and partly merges them
-    :param overview: daily new cases and deaths over time in all federal states (per general age group and sex)
-    :param casting: NowCasting Dashboard data
-    :param breakouts: breakouts (= 2 or more cases) that were traced and attributed to an infection setting
-    :param cases_age1: weekly number of new cases per age group in 5-year intervalls
-    :param cases_age2: weekly incidences per age group in 5-year intervalls
-    :param deaths1: weekly number of deaths
-    :param deaths2: weekly number of deaths per age group
-    :param deaths3: weekly number of deaths per age group and sex
-    :param tests1: testing capacities
-    :param tests2: testing tailbacks
-    :param clinical: reported clinical indications (hospitalization, symptom prevalence) and deaths per sex
-    :return: cleaned pandas dataframes
+    converts string columns with German-locale numbers to floats in one vectorized pass over all columns; columns that
+    are numeric already are kept as they are
+    :param df: pandas dataframe
+    :param columns: columns to convert (default: all columns)
+    :param decimal: decimal separator
+    :param thousands: thousands separator (None if the numbers have none)
+    :param sentinels: dictionary of placeholder strings and the values they stand for, e.g. {'<4': 3, '-': 0}
+    :return: pandas dataframe with numeric columns (empty strings and NaN stay NaN)
+    :raises ValueError: for a value that is no number, naming its column and row
     '''
-    #### general covid case overview (RKI dashboard data)
-
-    # overview, casting, breakouts, cases_age1, cases_age2, deaths1, deaths2, deaths3, tests1, tests2, clinical =\
-    #     overview.copy(deep=True), \
-    #     casting.copy(deep=True), \
-    #     breakouts.copy(deep=True), \
-    #     cases_age1.copy(deep=True), \
-    #     cases_age2.copy(deep=True), \
-    #     deaths1.copy(deep=True), \
-    #     deaths2.copy(deep=True), \
-    #     deaths3.copy(deep=True), \
-    #     tests1.copy(deep=True), \
-    #     tests2.copy(deep=True), \
-    #     clinical.copy(deep=True)
-
-    # rename report and reference date (date of suspected/confirmed infection), calculate delay
-    overview['report_date'] = pd.to_datetime(overview['Meldedatum'], format='%Y/%m/%d %H:%M:%S').dt.date
-    overview['ref_date'] = pd.to_datetime(overview['Refdatum'], format='%Y/%m/%d %H:%M:%S').dt.date
-    overview['report_delay'] = (overview['report_date'] - overview['ref_date']).dt.days
-    overview.rename(columns={'IstErkrankungsbeginn': 'ref_eq_rep'})
-    # create new date columns for weeks and days to compare with other tables
-    overview['ref_date_dayofweek'] = pd.DatetimeIndex(overview['ref_date']).dayofweek
-    overview['ref_date_year'] = pd.DatetimeIndex(overview['ref_date']).year
-    overview['ref_date_week'] = pd.DatetimeIndex(overview['ref_date']).weekofyear
-    # map week 53 to 2020
-    overview.loc[((overview['ref_date_year'] == 2021) & (overview['ref_date_week'] == 53)), 'ref_date_year'] = 2020
-    overview['report_date_dayofweek'] = pd.DatetimeIndex(overview['report_date']).dayofweek
-    overview['report_date_year'] = pd.DatetimeIndex(overview['report_date']).year
-    overview['report_date_week'] = pd.DatetimeIndex(overview['report_date']).weekofyear
+    columns = df.columns if columns is None else columns
+    text_cols = [col for col in columns if not pd.api.types.is_numeric_dtype(df[col])]
+    if not text_cols:
+        return df
+
+    # all string columns as one flat array; only its distinct strings are normalized and parsed (the tables repeat
+    # values heavily), missing values get code -1
+    codes, uniques = pd.factorize(df[text_cols].to_numpy().ravel())
+    text = pd.Series(uniques, dtype='object').astype('str')
+    is_sentinel = text.isin(list(sentinels)) if sentinels else pd.Series(False, index=text.index)
+    normalized = text
+    if thousands:
+        normalized = normalized.str.replace(thousands, '', regex=False)
+    if decimal != '.':
+        normalized = normalized.str.replace(decimal, '.', regex=False)
+    numbers = pd.to_numeric(normalized.mask(is_sentinel, 'nan'), errors='coerce').astype('float64')
+    # strings that did not parse must be missing values (or sentinels)
+    invalid = numbers.isna() & ~is_sentinel & ~text.str.strip().str.lower().isin(['', 'nan', 'none'])
+    if invalid.any():
+        position = int(np.argmax(np.append(invalid.values, False)[codes]))
+        row, col = divmod(position, len(text_cols))
+        raise ValueError(f'cannot parse {text[codes[position]]!r} in column {text_cols[col]!r} '
+                         f'(row {df.index[row]!r}) as a number')
+    if is_sentinel.any():
+        numbers[is_sentinel] = text[is_sentinel].map(sentinels).astype('float')
+    numbers = np.append(numbers.values, np.nan)[codes]
+
+    # assemble a new frame instead of assigning column by column into the string block
+    parsed = pd.DataFrame(numbers.reshape(len(df), len(text_cols)), index=df.index, columns=text_cols)
+    return pd.concat([df.drop(text_cols, axis=1), parsed], axis=1)[df.columns]
+
+def date_features(dates, format='%Y/%m/%d %H:%M:%S'):
+    '''
+    parses a date column once and derives all calendar features from the day numbers in one vectorized pass
+    :param dates: pandas series of date strings (categorical series are parsed per category only)
+    :param format: date format of the strings
+    :return: dictionary of numpy arrays: date (datetime64, day precision), days (days since 1970-01-01), dayofweek
+    (Monday=0), year (calendar year, except that ISO week 53 is mapped to 2020) and week (ISO calendar week); missing
+    dates give NaT and NaN (the other features are then float arrays)
+    '''
+    if isinstance(dates.dtype, pd.CategoricalDtype):
+        features = date_features(pd.Series(dates.cat.categories), format=format)
+        codes = dates.cat.codes.values
+        # code -1 is a missing value, not the last category
+        return mask_missing({key: values[codes] for key, values in features.items()}, codes < 0)
+
+    date = pd.to_datetime(dates, format=format).values.astype('datetime64[D]')
+    missing = np.isnat(date)
+    days = np.where(missing, 0, date.astype('int64'))
+    # 1970-01-01 was a Thursday
+    dayofweek = (days + 3) % 7
+    # the ISO week belongs to the year of its Thursday and counts from that year's first Thursday
+    thursday = days - dayofweek + 3
+    thursday_year = thursday.astype('datetime64[D]').astype('datetime64[Y]')
+    week = (thursday - thursday_year.astype('datetime64[D]').astype('int64')) // 7 + 1
+    year = days.astype('datetime64[D]').astype('datetime64[Y]').astype('int64') + 1970
     # map week 53 to 2020
-    overview.loc[((overview['report_date_year'] == 2021) & (overview['report_date_week'] == 53)), 'report_date_year'] = 2020
+    year[(year == 2021) & (week == 53)] = 2020
 
-    # drop inconclusive/redundant columns
-    overview.drop(['Altersgruppe2', 'Datenstand', 'Meldedatum', 'Refdatum', 'ObjectId'], axis=1, inplace=True)
+    return mask_missing({'date': date.astype('datetime64[ns]'),
+                         'days': days,
+                         'dayofweek': dayofweek.astype('int8'),
+                         'year': year.astype('int16'),
+                         'week': week.astype('int8')}, missing)
 
-    #### reproductive factor calculation from RKI nowcasting
+def mask_missing(features, missing):
+    '''
+    sets the date features of missing dates to NaT/NaN
+    :param features: dictionary of numpy arrays (see date_features)
+    :param missing: boolean numpy array, True for missing dates
+    :return: dictionary of numpy arrays, unchanged if no date is missing
+    '''
+    if not missing.any():
+        return features
+    return {key: np.where(missing, np.datetime64('NaT') if values.dtype.kind == 'M' else np.nan, values)
+            for key, values in features.items()}
 
-    # drop faulty rows and rename columns
-    casting = casting \
-        .drop(casting.index[319::], axis=0) \
-        .rename(columns={'Datum': 'date',
-                         'Schätzer_Neuerkrankungen': 'est_new_cases',
-                         'UG_PI_Neuerkrankungen': 'pred_lower',
-                         'OG_PI_Neuerkrankungen': 'pred_upper',
-                         'Schätzer_Neuerkrankungen_ma4': 'est_new_cases_smooth',
-                         'UG_PI_Neuerkrankungen_ma4': 'pred_lower_smooth',
-                         'OG_PI_Neuerkrankungen_ma4': 'pred_upper_smooth',
-                         'Schätzer_Reproduktionszahl_R': 'est_r',
-                         'UG_PI_Reproduktionszahl_R': 'r_lower',
-                         'OG_PI_Reproduktionszahl_R': 'r_upper',
-                         'Schätzer_7_Tage_R_Wert': 'est_r7',
-                         'UG_PI_7_Tage_R_Wert': 'r7_upper',
-                         'OG_PI_7_Tage_R_Wert': 'r7_lower'})
+def clean_overview(overview, consume=False):
+    '''
+    cleans the general covid case overview (RKI dashboard data): adds report/reference dates, reporting delay and
+    calendar week columns and drops inconclusive/redundant columns
+    :param overview: daily new cases and deaths over time in all federal states (per general age group and sex)
+    :param consume: clean the given dataframe in place, so the raw date strings are freed as soon as they are parsed
+    (the caller must not use it afterwards); otherwise it is left unchanged and its columns are shared, not copied
+    :return: cleaned pandas dataframe
+    '''
+    if not consume:
+        overview = overview.copy(deep=False)
+    # drop inconclusive/redundant columns (single deletes instead of drop, which would copy the whole table)
+    for col, new in COLUMN_NAMES['overview'].items():
+        if new is None and col in overview.columns:
+            del overview[col]
+
+    # rename report and reference date (date of suspected/confirmed infection), calculate delay
+    report = date_features(overview.pop('Meldedatum'))
+    ref = date_features(overview.pop('Refdatum'))
+    overview['report_date'] = report['date']
+    overview['ref_date'] = ref['date']
+    delay = report['days'] - ref['days']
+    overview['report_delay'] = delay.astype('int16') if delay.dtype.kind == 'i' else delay
+    # create new date columns for weeks and days to compare with other tables (week 53 already mapped to 2020)
+    for prefix, features in [('ref_date', ref), ('report_date', report)]:
+        overview[f'{prefix}_dayofweek'] = features['dayofweek']
+        overview[f'{prefix}_year'] = features['year']
+        overview[f'{prefix}_week'] = features['week']
+
+    return overview
+
+def clean_casting(casting):
+    '''
+    cleans the reproductive factor calculation from RKI nowcasting
+    :param casting: NowCasting Dashboard data
+    :return: cleaned pandas dataframe
+    '''
+    # rename columns, drop faulty rows
+    casting = select_columns(casting, 'casting')
+    casting = casting.drop(casting.index[319::], axis=0)
     # add date and week
     casting['date'] = pd.to_datetime(casting['date'], format='%d.%m.%Y').dt.date
     casting['week'] = pd.DatetimeIndex(casting['date']).weekofyear
     # remove incompatible string characters, columns to floats
-    for col in ['est_r', 'r_upper', 'r_lower', 'est_r7', 'r7_upper', 'r7_lower']:
-        casting[col] = casting[col].apply(lambda x: math.nan if x == '.' else float(x.replace(',', '.')))
+    r_cols = ['est_r', 'r_upper', 'r_lower', 'est_r7', 'r7_upper', 'r7_lower']
+    casting = parse_numeric(casting, r_cols, sentinels={'.': math.nan})
 
-    #### cases which were be counted as a breakout
+    return casting
 
+def clean_breakouts(breakouts):
+    '''
+    cleans the cases which were counted as a breakout
+    :param breakouts: breakouts (= 2 or more cases) that were traced and attributed to an infection setting
+    :return: cleaned pandas dataframe
+    '''
     # drop redundant columns, rename columns
-    breakouts = breakouts \
-        .rename(columns={'Meldewoche': 'week', 'n': 'num_breakouts'}) \
-        .drop('sett_f', axis=1)
+    breakouts = select_columns(breakouts, 'breakouts')
 
-    #### cases per age
+    return breakouts
 
+def clean_cases_age(cases_age1, cases_age2):
+    '''
+    cleans and merges the weekly cases and incidences per age group
+    :param cases_age1: weekly number of new cases per age group in 5-year intervalls
+    :param cases_age2: weekly incidences per age group in 5-year intervalls
+    :return: cleaned pandas dataframe
+    '''
     # remove incompatible string characters, columns to floats
-    for col in cases_age2.columns[1::]:
-        cases_age2[col] = cases_age2[col].str.replace(',', '.').astype('float')
+    cases_age2 = parse_numeric(cases_age2, cases_age2.columns[1::])
     # merge
     cases_age = pd.merge(cases_age1, cases_age2, on='Altersgruppe', suffixes=('_total', '_incidence'))
 
-    #### deaths
+    return cases_age
 
+def clean_deaths(deaths1, deaths2, deaths3):
+    '''
+    cleans and merges the weekly deaths (total, per age group and per age group and sex)
+    :param deaths1: weekly number of deaths
+    :param deaths2: weekly number of deaths per age group
+    :param deaths3: weekly number of deaths per age group and sex
+    :return: cleaned pandas dataframe
+    '''
     # drop redundant columns, rename columns
-    deaths1 = deaths1 \
-        .rename(columns={'Sterbewoche': 'week', 'Anzahl verstorbene COVID-19 Fälle': 'deaths_total'}) \
-        .drop('Sterbejahr', axis=1)
-    deaths2 = deaths2 \
-        .rename(columns={'Sterbewoche': 'week',
-                         'AG 0-9 Jahre': 'age_0',
-                         'AG 10-19 Jahre': 'age_10',
-                         'AG 20-29 Jahre': 'age_20',
-                         'AG 30-39 Jahre': 'age_30',
-                         'AG 40-49 Jahre': 'age_40',
-                         'AG 50-59 Jahre': 'age_50',
-                         'AG 60-69 Jahre': 'age_60',
-                         'AG 70-79 Jahre': 'age_70',
-                         'AG 80-89 Jahre': 'age_80',
-                         'AG 90+ Jahre': 'age_90'}) \
-        .drop('Sterbjahr', axis=1)
-    deaths3 = deaths3 \
-        .rename(columns={'Sterbewoche': 'week',
-                         'Männer, AG 0-19 Jahre': 'M0_19',
-                         'Männer, AG 20-39 Jahre': 'M20_39',
-                         'Männer, AG 40-59 Jahre': 'M40_59',
-                         'Männer, AG 60-79 Jahre': 'M60_79',
-                         'Männer, AG 80+ Jahre': 'M80',
-                         'Frauen, AG 0-19 Jahre': 'F0_19',
-                         'Frauen, AG 20-39 Jahre': 'F20_39',
-                         'Frauen, AG 40-59 Jahre': 'F40_59',
-                         'Frauen, AG 60-79 Jahre': 'F60_79',
-                         'Frauen, AG 80+ Jahre': 'F80'}) \
-        .drop('Sterbjahr', axis=1)
+    deaths1 = select_columns(deaths1, 'deaths1')
+    deaths2 = select_columns(deaths2, 'deaths2')
+    deaths3 = select_columns(deaths3, 'deaths3')
     # merge
     deaths = func.reduce(lambda left, right: pd.merge(left, right, on='week'), [deaths1, deaths2, deaths3])
     # assume '<4' deaths as 3
-    deaths = deaths.replace('<4', '3').astype('int')
+    deaths = parse_numeric(deaths, sentinels={'<4': 3}).astype('int')
 
-    #### PRC test capacities
+    return deaths
 
+def clean_tests(tests1, tests2):
+    '''
+    cleans and merges the PCR test capacities and tailbacks
+    :param tests1: testing capacities
+    :param tests2: testing tailbacks
+    :return: cleaned pandas dataframe
+    '''
     # rename columns
-    tests1 = tests1.rename(columns={'KW, für die die Angabe prognostisch erfolgt ist:': 'week',
-                                    'Anzahl übermittelnde Labore': 'laboratories',
-                                    'Testkapazität pro Tag': 'daily_cap',
-                                    'Theoretische wöchentliche Kapazität anhand von Wochenarbeitstagen': 'weekly_cap_est',
-                                    'Reale Testkapazität zum Zeitpunkt der Abfrage': 'weekly_cap_real'})
+    tests1 = select_columns(tests1, 'tests1')
     # remove incompatible string characters and get week, test capacities as integers
     tests1['week'] = tests1['week'].str.split('KW').str[1].astype('int')
-    tests1['weekly_cap_est'] = tests1['weekly_cap_est'].replace('-', 0).astype('int')
-    tests1['weekly_cap_real'] = tests1['weekly_cap_real'].replace('-', 0).astype('int')
+    cap_cols = ['weekly_cap_est', 'weekly_cap_real']
+    tests1 = parse_numeric(tests1, cap_cols, sentinels={'-': 0}).astype({col: 'int' for col in cap_cols})
     # drop faulty columns and rename
-    tests2 = tests2.drop(['Unnamed: 3'], axis=1) \
-        .rename(columns={'Labore mit Rückstau': 'laboratories_tailback',
-                         'KW': 'week',
-                         'Probenrückstau': 'tests_tailback'})
+    tests2 = select_columns(tests2, 'tests2')
     # merge
     tests = pd.merge(tests1, tests2, on='week', how='outer').fillna(0)
     # alias weeks for 2021 with higher numbers
     tests['week'] = tests['week'].replace(1, 54).replace(2, 55)
 
-    #### clinical data
-
-    # remove incompatible string characters and columns as integers
-    clinical = clinical.rename(columns={'Meldejahr': 'year',
-                                    'MW': 'week',
-                                    'Fälle gesamt': 'cases_tot',
-                                    'Mittelwert Alter (Jahre)': 'mean_age',
-                                    'Männer': 'male_perc',
-                                    'Frauen': 'female_perc',
-                                    'Anzahl mit Angaben zu Symptomen': 'symptoms_reported',
-                                    'Anteil keine, bzw. keine für COVID-19 bedeutsamen Symptome': 'no_symptoms_perc',
-                                    'Anzahl mit Angaben zur Hospitalisierung': 'hospital_reported',
-                                    'Anzahl hospitalisiert': 'hospital_num',
-                                    'Anteil hospitalisiert': 'hospital_perc',
-                                        'Anzahl Verstorben': 'deaths_num',
-                                        'Anteil Verstorben': 'deaths_perc'
-                                        }).drop(['Unnamed: 0'], axis=1)
-    # remove incompatible string characters, columns to floats
-    for col in ['male_perc', 'female_perc', 'no_symptoms_perc', 'hospital_perc', 'deaths_perc']:
-        clinical[col] = clinical[col].str.replace(',', '.').astype('float')
-
-    return overview, casting, breakouts, cases_age, deaths, tests, clinical
-
-
+    return tests
 
+def clean_clinical(clinical):
+    '''
+    cleans the clinical data
+    :param clinical: reported clinical indications (hospitalization, symptom prevalence) and deaths per sex
+    :return: cleaned pandas dataframe
+    '''
+    # drop faulty columns and rename
+    clinical = select_columns(clinical, 'comorb')
+    # remove incompatible string characters, columns to floats
+    perc_cols = ['male_perc', 'female_perc', 'no_symptoms_perc', 'hospital_perc', 'deaths_perc']
+    clinical = parse_numeric(clinical, perc_cols)
 
+    return clinical
 
+def data_clean(overview, casting, breakouts, cases_age1, cases_age2, deaths1, deaths2, deaths3, tests1, tests2, clinical,
+               consume=False, callback=None, profile=None, trace=None):
+    '''
+    takes pandas dataframes of the raw extracted data and preprocesses, cleans and partly merges them; the given
+    dataframes are left unchanged unless consume is set, the cleaned ones may share columns with them
+    :param overview: daily new cases and deaths over time in all federal states (per general age group and sex)
+    :param casting: NowCasting Dashboard data
+    :param breakouts: breakouts (= 2 or more cases) that were traced and attributed to an infection setting
+    :param cases_age1: weekly number of new cases per age group in 5-year intervalls
+    :param cases_age2: weekly incidences per age group in 5-year intervalls
+    :param deaths1: weekly number of deaths
+    :param deaths2: weekly number of deaths per age group
+    :param deaths3: weekly number of deaths per age group and sex
+    :param tests1: testing capacities
+    :param tests2: testing tailbacks
+    :param clinical: reported clinical indications (hospitalization, symptom prevalence) and deaths per sex
+    :param consume: hand the raw dataframes over to data_clean: the overview is cleaned in place and its raw date
+    strings are freed as soon as they are parsed, so the caller must not use the raw dataframes afterwards
+    :param callback: optional function that gets a record with wall/CPU time, memory and rows per cleaned table
+    ('clean:<table>', see instrumentation.run_stage), e.g. instrumentation.log_callback()
+    :param profile: stage name(s) to run under cProfile, e.g. 'clean:deaths'
+    :param trace: stage name(s) to run with tracemalloc
+    :return: cleaned pandas dataframes
+    '''
+    stage = func.partial(instr.run_stage, callback=callback, profile=profile, trace=trace)
 
+    #### general covid case overview (RKI dashboard data)
 
+    # skip tables that were already cleaned while streaming them in (see data_load with chunksize)
+    if 'Meldedatum' in overview.columns:
+        overview = stage('clean:overview', clean_overview, overview, consume=consume)
 
+    casting = stage('clean:casting', clean_casting, casting)
+    breakouts = stage('clean:breakouts', clean_breakouts, breakouts)
+    cases_age = stage('clean:cases_age', clean_cases_age, cases_age1, cases_age2)
+    deaths = stage('clean:deaths', clean_deaths, deaths1, deaths2, deaths3)
+    tests = stage('clean:tests', clean_tests, tests1, tests2)
+    clinical = stage('clean:clinical', clean_clinical, clinical)
 
+    return overview, casting, breakouts, cases_age, deaths, tests, clinical
 
+# cleaned tables as returned by data_clean: cleaning function and the raw sources it takes (in order)
+TABLES = {'overview': (clean_overview, ['overview']),
+          'casting': (clean_casting, ['casting']),
+          'breakouts': (clean_breakouts, ['breakouts']),
+          'cases_age': (clean_cases_age, ['cases_age1', 'cases_age2']),
+          'deaths': (clean_deaths, ['deaths1', 'deaths2', 'deaths3']),
+          'tests': (clean_tests, ['tests1', 'tests2']),
+          'clinical': (clean_clinical, ['comorb'])}
 
+def load_table(name, chunksize=None):
+    '''
+    loads the raw sources of a single cleaned table and cleans them
+    :param name: key of the table in TABLES
+    :param chunksize: if given, stream RKI_COVID19.csv in chunks of this many rows (overview only)
+    :return: cleaned pandas dataframe
+    '''
+    if name == 'overview' and chunksize:
+        return load_overview_chunked(SOURCES['overview'][0], chunksize=chunksize)
+    clean, sources = TABLES[name]
+    if name == 'overview':
+        return clean_overview(load_source('overview', rename=True), consume=True)
+    return clean(*[load_source(source, rename=True) for source in sources])
+
+def timed(function, *args, **kwargs):
+    '''
+    calls a function and measures its wall time
+    :return: result of the function call, wall time in seconds
+    '''
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
 
+def data_load_parallel(max_workers=None, processes=False, chunksize=None, timings=None):
+    '''
+    loads all csv sources concurrently and cleans every table as soon as all of its sources are loaded; the overview
+    is loaded and cleaned in a single task, so the raw dump never has to be passed between workers
+    :param max_workers: number of worker threads/processes (default: one per source, at most the number of CPUs)
+    :param processes: use a process pool instead of a thread pool (tables are then pickled between processes)
+    :param chunksize: if given, stream RKI_COVID19.csv in chunks of this many rows (the overview is cleaned on the fly)
+    :param timings: optional dictionary that is filled with the wall times in seconds per loaded source
+    ('load:<source>'), per cleaned table ('clean:<table>', for the overview including its loading) and in total
+    ('total')
+    :return: cleaned pandas dataframes (same as data_clean)
+    '''
+    if timings is None:
+        timings = {}
+    if max_workers is None:
+        max_workers = min(len(SOURCES), os.cpu_count() or 1)
+    start = time.perf_counter()
+
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    raw, tables = {}, {}
+    with executor(max_workers=max_workers) as pool:
+        # submit in SOURCES order, i.e. the large RKI dump first
+        futures = {}
+        for name in SOURCES:
+            if name == 'overview':
+                futures[pool.submit(timed, load_table, 'overview', chunksize=chunksize)] = ('clean', 'overview')
+            else:
+                futures[pool.submit(timed, load_source, name)] = ('load', name)
+
+        pending = set(futures)
+        while pending:
+            future = next(as_completed(pending))
+            pending.remove(future)
+            step, name = futures[future]
+            result, seconds = future.result()
+            timings[f'{step}:{name}'] = seconds
+            if step == 'clean':
+                tables[name] = result
+                continue
+
+            raw[name] = result
+            # clean every table whose sources are complete now
+            for table, (clean, sources) in TABLES.items():
+                if name in sources and all(source in raw for source in sources):
+                    cleaning = pool.submit(timed, clean, *[raw.pop(source) for source in sources])
+                    futures[cleaning] = ('clean', table)
+                    pending.add(cleaning)
+
+    timings['total'] = time.perf_counter() - start
+    return tuple(tables[table] for table in TABLES)
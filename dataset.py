@@ -0,0 +1,73 @@
+# This module contains a lazy dataset of the cleaned tables: a table is loaded from its csv sources and cleaned on
+# first access only, so a report that needs e.g. the test capacities does not parse the RKI dashboard dump
+
+import data_preprocess as dp
+
+class Dataset:
+    '''
+    lazy access to the cleaned tables of data_preprocess.TABLES via attribute (ds.tests) or key (ds['tests']): only
+    the raw sources of the requested table are loaded, and the cleaned table is kept for later accesses
+    '''
+    def __init__(self, chunksize=None, cache_dir=None):
+        '''
+        :param chunksize: if given, stream RKI_COVID19.csv in chunks of this many rows when loading the overview
+        :param cache_dir: if given, read the cleaned tables from this Arrow cache and keep it up to date (see
+        data_cache.load_cached_table)
+        '''
+        self.chunksize = chunksize
+        self.cache_dir = cache_dir
+        self._tables = {}
+
+    def __getitem__(self, name):
+        if name not in dp.TABLES:
+            raise KeyError(f'unknown table {name}, expected one of {list(dp.TABLES)}')
+        if name not in self._tables:
+            if self.cache_dir is None:
+                self._tables[name] = dp.load_table(name, chunksize=self.chunksize)
+            else:
+                # pyarrow is only imported when the cache is used
+                import data_cache as dc
+                self._tables[name] = dc.load_cached_table(name, self.cache_dir, chunksize=self.chunksize)
+        return self._tables[name]
+
+    def __getattr__(self, name):
+        # only called for attributes that do not exist otherwise
+        if name.startswith('_') or name not in dp.TABLES:
+            raise AttributeError(f"'Dataset' object has no attribute '{name}'")
+        return self[name]
+
+    def __dir__(self):
+        return list(super().__dir__()) + list(dp.TABLES)
+
+    def __repr__(self):
+        return f'Dataset(loaded={self.loaded})'
+
+    def keys(self):
+        '''
+        :return: names of all tables
+        '''
+        return list(dp.TABLES)
+
+    @property
+    def loaded(self):
+        '''
+        :return: names of the tables that were loaded already
+        '''
+        return [name for name in dp.TABLES if name in self._tables]
+
+    def reset(self, name=None):
+        '''
+        forgets a loaded table (or all), so it is loaded again on the next access
+        :param name: table name, None for all tables
+        '''
+        if name is None:
+            self._tables.clear()
+        else:
+            self._tables.pop(name, None)
+
+    def tables(self):
+        '''
+        loads all tables that were not loaded yet
+        :return: cleaned pandas dataframes in the order of data_clean
+        '''
+        return tuple(self[name] for name in dp.TABLES)
@@ -0,0 +1,153 @@
+# This module contains functions for instrumenting single stages of the data pipeline (loading and cleaning of the
+# single tables): wall time, CPU time, memory and rows are reported to a callback, and a single stage can be
+# profiled with cProfile or tracemalloc
+
+import os
+import io
+import json
+import time
+import pstats
+import logging
+import cProfile
+import threading
+import tracemalloc
+import pandas as pd
+
+def current_rss_mb():
+    '''
+    current resident set size of the current process (Linux only)
+    :return: RSS in MB, None if not available
+    '''
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError):
+        return None
+
+class RSSSampler:
+    '''
+    samples the RSS of the current process in a background thread to get the peak of a single stage (the peak RSS of
+    the process only ever grows); without noticeable overhead, unlike tracemalloc
+    '''
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = current_rss_mb()
+            if rss is not None:
+                self.peak = rss if self.peak is None else max(self.peak, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start = current_rss_mb()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def count_rows(obj):
+    '''
+    number of rows of a dataframe/series, or of all dataframes/series in a tuple or list
+    :return: number of rows, None if there are no dataframes/series
+    '''
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return len(obj)
+    if isinstance(obj, (tuple, list)):
+        rows = [count_rows(item) for item in obj]
+        rows = [row for row in rows if row is not None]
+        return sum(rows) if rows else None
+    return None
+
+def run_stage(name, function, *args, callback=None, profile=None, trace=None, **kwargs):
+    '''
+    runs a single pipeline stage; without callback (and no profiling of this stage) the function is just called
+    :param name: stage name, e.g. 'load:overview' or 'clean:deaths'
+    :param function: function of the stage
+    :param callback: function that is called with a record dictionary per stage: stage, wall_s, cpu_s, peak_mb (RSS
+    increase, None without /proc), rows_in, rows_out, allocated_bytes (peak of traced allocations, only for the
+    traced stage) and profile/tracemalloc (see below)
+    :param profile: stage name (or list of names) to run under cProfile; the record gets the pstats.Stats as 'profile'
+    :param trace: stage name (or list of names) to run with tracemalloc; the record gets the top allocation sites as
+    'tracemalloc'
+    :param kwargs: further arguments for the function
+    :return: result of the function
+    '''
+    profiled = profile is not None and name in ([profile] if isinstance(profile, str) else profile)
+    traced = trace is not None and name in ([trace] if isinstance(trace, str) else trace)
+    if callback is None and not profiled and not traced:
+        return function(*args, **kwargs)
+
+    record = {'stage': name, 'rows_in': count_rows(args), 'allocated_bytes': None}
+    if traced:
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        traced_start = tracemalloc.get_traced_memory()[0]
+    profiler = cProfile.Profile() if profiled else None
+
+    with RSSSampler() as sampler:
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            if profiler:
+                profiler.disable()
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    record.update(wall_s=wall, cpu_s=cpu, rows_out=count_rows(result),
+                  peak_mb=sampler.peak - sampler.start if sampler.peak is not None else None)
+    if profiler:
+        record['profile'] = pstats.Stats(profiler)
+    if traced:
+        record['allocated_bytes'] = tracemalloc.get_traced_memory()[1] - traced_start
+        record['tracemalloc'] = tracemalloc.take_snapshot().compare_to(before, 'lineno')[:20]
+        if started_tracing:
+            tracemalloc.stop()
+
+    if callback is not None:
+        callback(record)
+    return result
+
+def log_callback(logger=None, level=logging.INFO):
+    '''
+    callback for run_stage that writes every record as one JSON line to a logger (profiles are summarized by their
+    total time, allocation sites are left out)
+    :param logger: logging.Logger (default: logger of this module)
+    :param level: log level
+    :return: callback function
+    '''
+    logger = logger or logging.getLogger(__name__)
+
+    def callback(record):
+        entry = {key: value for key, value in record.items() if key not in ['profile', 'tracemalloc']}
+        if 'profile' in record:
+            entry['profile_total_s'] = record['profile'].total_tt
+        logger.log(level, json.dumps(entry))
+    return callback
+
+def profile_summary(record, sort='cumulative', limit=20):
+    '''
+    text summary of the cProfile or tracemalloc capture of a stage record
+    :param record: record dictionary of a profiled/traced stage (see run_stage)
+    :param sort: sort key of the cProfile statistics
+    :param limit: number of functions/allocation sites to show
+    :return: summary string
+    '''
+    lines = []
+    if 'profile' in record:
+        stream = io.StringIO()
+        pstats.Stats(stream=stream).add(record['profile']).sort_stats(sort).print_stats(limit)
+        lines.append(stream.getvalue())
+    if 'tracemalloc' in record:
+        lines.extend(str(stat) for stat in record['tracemalloc'][:limit])
+    return '\n'.join(lines)
@@ -1,9 +1,16 @@
 # This module contains various plot functions in order to visualize analysis results
 
+import os
+import time
+import hashlib
+import inspect
 import matplotlib.pyplot as plt
 import seaborn as sns
 import matplotlib as mpl
+import numpy as np
+import pandas as pd
 from cycler import cycler
+from concurrent.futures import ProcessPoolExecutor
 
 def init_plot_settings(color):
     '''
@@ -38,7 +45,60 @@ def color_cycles():
                'deepskyblue', 'mediumvioletred', 'darkgoldenrod']
     return default, color1, color2, color3
 
-def plot_heatmap(df, title='title', filename='heatmap', annot=True, fmt='.1f', figsize=(15, 7), center=None):
+# heatmaps with more cells are drawn as a single image (see fast_heatmap) unless requested otherwise
+FAST_HEATMAP_CELLS = 5000
+# maximum number of annotated cells in fast heatmaps; larger heatmaps are drawn without annotations
+FAST_HEATMAP_MAX_ANNOT = 1500
+
+def fast_heatmap(df, ax, cbar_ax=None, annot=True, fmt='.1f', center=None, cmap='twilight_shifted',
+                 max_annot=FAST_HEATMAP_MAX_ANNOT, max_ticks=60):
+    '''
+    draws a heatmap of a given pandas dataframe as a single image instead of one patch per cell, in the same
+    coordinates as seaborn (cell i spans i to i+1); annotations are only drawn up to max_annot cells and tick labels
+    are thinned out to max_ticks per axis
+    :param df: pandas dataframe
+    :param ax: axis to draw on
+    :param cbar_ax: axis for the colorbar (default: taken from ax)
+    :param annot: annotate values in the heatmap
+    :param fmt: format the display of values
+    :param center: reference heatmap colormap
+    :param cmap: colormap
+    :param max_annot: maximum number of annotated cells
+    :param max_ticks: maximum number of tick labels per axis
+    :return: axis object
+    '''
+    values = np.ma.masked_invalid(df.values.astype('float'))
+    vmin, vmax = values.min(), values.max()
+    if center is not None:
+        # symmetric color range around the center, like seaborn
+        vrange = max(vmax - center, center - vmin)
+        vmin, vmax = center - vrange, center + vrange
+    n_rows, n_cols = values.shape
+    image = ax.imshow(values, cmap=cmap, vmin=vmin, vmax=vmax, aspect='auto', interpolation='nearest',
+                      extent=(0, n_cols, n_rows, 0))
+    cbar = ax.figure.colorbar(image, ax=None if cbar_ax else ax, cax=cbar_ax)
+    cbar.outline.set_visible(False)
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+
+    # tick labels at the cell centers, thinned out for large matrices
+    for axis, labels, set_ticks, set_labels in [(n_cols, df.columns, ax.set_xticks, ax.set_xticklabels),
+                                                 (n_rows, df.index, ax.set_yticks, ax.set_yticklabels)]:
+        step = int(np.ceil(axis / max_ticks))
+        set_ticks(np.arange(0, axis, step) + 0.5)
+        set_labels([str(label) for label in labels[::step]])
+
+    if annot and values.size <= max_annot:
+        # black or white text depending on the luminance of the cell color
+        colors = image.cmap(image.norm(values.filled(np.nan)))
+        luminance = colors[..., :3] @ np.array([0.2126, 0.7152, 0.0722])
+        for (row, col), value in np.ndenumerate(values.filled(np.nan)):
+            if not np.isnan(value):
+                ax.text(col + 0.5, row + 0.5, format(value, fmt), ha='center', va='center', rotation=90,
+                        color='black' if luminance[row, col] > 0.408 else 'white')
+    return ax
+
+def plot_heatmap(df, title='title', filename='heatmap', annot=True, fmt='.1f', figsize=(15, 7), center=None, fast=None):
     '''
     plots heatmap of a given pandas dataframe and saves it as PNG file
     :param df: pandas dataframe
@@ -48,16 +108,23 @@ def plot_heatmap(df, title='title', filename='heatmap', annot=True, fmt='.1f', f
     :param fmt: format the display of values
     :param figsize: plot size
     :param center: reference heatmap colormap
+    :param fast: draw as single image without layout pass (see fast_heatmap); default: above FAST_HEATMAP_CELLS cells
     :return: figure and axis object
     '''
+    if fast is None:
+        fast = df.size > FAST_HEATMAP_CELLS
     fig, ax = plt.subplots(figsize=figsize)
-    sns.heatmap(df, annot=annot, annot_kws={'rotation': 90}, fmt=fmt, ax=ax, cmap='twilight_shifted', center=center)
+    if fast:
+        fast_heatmap(df, ax, annot=annot, fmt=fmt, center=center)
+    else:
+        sns.heatmap(df, annot=annot, annot_kws={'rotation': 90}, fmt=fmt, ax=ax, cmap='twilight_shifted', center=center)
     ax.axes.set_title(title)
-    plt.tight_layout()
+    if not fast:
+        plt.tight_layout()
     fig.savefig(f"results/{filename}.png")
     return fig, ax
 
-def plot_heatmap_and_line(df_heat, x_line, y_line, df_line=None, title1='title1', title2='title2', filename='heatmap_line', figsize=(15, 10),  annot=True, fmt='.1f'):
+def plot_heatmap_and_line(df_heat, x_line, y_line, df_line=None, title1='title1', title2='title2', filename='heatmap_line', figsize=(15, 10),  annot=True, fmt='.1f', fast=None):
     '''
     plots heatmap of a given pandas dataframe alog with a line plot and saves it as PNG file
     :param df_heat: pandas dataframe for heatmap
@@ -70,16 +137,23 @@ def plot_heatmap_and_line(df_heat, x_line, y_line, df_line=None, title1='title1'
     :param figsize: plot size
     :param annot: annotate values in the heatmap
     :param fmt: format the display of values
+    :param fast: draw as single image without layout pass (see fast_heatmap); default: above FAST_HEATMAP_CELLS cells
     :return: figure and axis object
     '''
+    if fast is None:
+        fast = df_heat.size > FAST_HEATMAP_CELLS
     fig, ax = plt.subplots(2, 2, figsize=figsize, sharex='col', gridspec_kw={'width_ratios': [100, 5], 'height_ratios': [3, 1]})
     ax[1, 1].remove()  # remove unused axis
 
     # heatmap
-    heat = sns.heatmap(df_heat, annot=annot, annot_kws={'rotation': 90}, fmt=fmt, ax=ax[0, 0], cbar_ax=ax[0, 1], cmap='twilight_shifted')
+    if fast:
+        heat = fast_heatmap(df_heat, ax[0, 0], cbar_ax=ax[0, 1], annot=annot, fmt=fmt)
+    else:
+        heat = sns.heatmap(df_heat, annot=annot, annot_kws={'rotation': 90}, fmt=fmt, ax=ax[0, 0], cbar_ax=ax[0, 1], cmap='twilight_shifted')
     ax[0, 0].set_title(title1)
 
-    width = heat.get_xticks()[1] - heat.get_xticks()[0]
+    # ticks from the cell centers to the left cell edges; fast_heatmap may thin out the ticks, its cells are 1 wide
+    width = 1 if fast else heat.get_xticks()[1] - heat.get_xticks()[0]
     new_ax = heat.get_xticks() - 0.5 * width
     heat.set_xticks(new_ax)
 
@@ -90,7 +164,8 @@ def plot_heatmap_and_line(df_heat, x_line, y_line, df_line=None, title1='title1'
         line = sns.lineplot(x=x_line, y=y_line, ax=ax[1, 0])
     ax[1, 0].set_title(title2)
     # heat.axes.set_title(title)
-    plt.tight_layout(pad=5)
+    if not fast:
+        plt.tight_layout(pad=5)
     fig.savefig(f"results/{filename}.png")
 
     return fig, ax
@@ -193,6 +268,96 @@ def plot_bar(df, title='title', xlabel='x', ylabel='y', filename='bar_chart', st
     fig.savefig(f"results/{filename}.png")
     return fig, ax
 
+def job_hash(func, args=(), kwargs=None):
+    '''
+    hashes a plot job: the plot function, its parameters and the content of all dataframes/arrays passed to it
+    :param func: plot function
+    :param args: positional arguments
+    :param kwargs: keyword arguments
+    :return: hex digest
+    '''
+    sha1 = hashlib.sha1(func.__name__.encode())
+    items = [(None, value) for value in args] + sorted((kwargs or {}).items())
+    for key, value in items:
+        sha1.update(repr(key).encode())
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            sha1.update(pd.util.hash_pandas_object(value).values.tobytes())
+            sha1.update(repr(list(value.columns) if isinstance(value, pd.DataFrame) else value.name).encode())
+        elif isinstance(value, (np.ndarray, pd.Index)):
+            array = np.asarray(value)
+            sha1.update(repr((array.shape, str(array.dtype))).encode())
+            if array.dtype.kind in 'biufcmM':
+                sha1.update(np.ascontiguousarray(array).tobytes())
+            else:
+                # object arrays (e.g. an Index of labels) by content, their bytes are the addresses of the objects
+                sha1.update(pd.util.hash_pandas_object(pd.Series(array.ravel()), index=False).values.tobytes())
+        else:
+            sha1.update(repr(value).encode())
+    return sha1.hexdigest()
+
+def job_filename(func, kwargs=None):
+    '''
+    output filename of a plot job (the filename argument or the default of the plot function)
+    :param func: plot function
+    :param kwargs: keyword arguments
+    :return: filename without extension
+    '''
+    return (kwargs or {}).get('filename', inspect.signature(func).parameters['filename'].default)
+
+def init_worker(rc):
+    '''
+    initializes a render process: non-interactive backend and the plot settings of the parent process
+    :param rc: matplotlib rc parameters
+    '''
+    plt.switch_backend('Agg')
+    mpl.rcParams.update(rc)
+
+def render_job(func, args, kwargs):
+    '''
+    renders a single plot job and closes its figure
+    :return: wall time in seconds
+    '''
+    start = time.perf_counter()
+    fig, _ = func(*args, **kwargs)
+    plt.close(fig)
+    return time.perf_counter() - start
+
+def render_batch(jobs, max_workers=None, force=False):
+    '''
+    renders a list of plot jobs in parallel worker processes with the non-interactive Agg backend; jobs whose PNG in
+    "results" was rendered from the same data and parameters are skipped
+    :param jobs: list of (plot function, positional arguments, keyword arguments) tuples
+    :param max_workers: number of worker processes (default: number of CPUs)
+    :param force: render all jobs, even if they are up to date
+    :return: dictionary {filename: wall time in seconds, or None if skipped}
+    '''
+    timings, todo = {}, []
+    for func, args, kwargs in jobs:
+        filename = job_filename(func, kwargs)
+        digest = job_hash(func, args, kwargs)
+        png, hash_file = f"results/{filename}.png", f"results/{filename}.hash"
+        if not force and os.path.exists(png) and os.path.exists(hash_file) \
+                and os.path.getmtime(png) >= os.path.getmtime(hash_file):
+            with open(hash_file) as file:
+                if file.read() == digest:
+                    timings[filename] = None
+                    continue
+        todo.append((filename, digest, func, args, kwargs))
+
+    os.makedirs('results', exist_ok=True)
+    rc = {key: value for key, value in mpl.rcParams.items() if key != 'backend'}
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(rc,)) as pool:
+        futures = [(filename, digest, pool.submit(render_job, func, args, kwargs))
+                   for filename, digest, func, args, kwargs in todo]
+        for filename, digest, future in futures:
+            timings[filename] = future.result()
+            # touch the PNG after writing the hash, so it counts as up to date on the next run
+            with open(f"results/{filename}.hash", 'w') as file:
+                file.write(digest)
+            os.utime(f"results/{filename}.png")
+
+    return timings
+
 # def plot_pie_chart(df, column, title='pie_chart', filename='pie_chart', colors=['#3EA607', '#5F9343', '#868686', '#93435F', '#A6073E']):
 #     series = df[column].dropna()
 #     pie, ax = plt.subplots(figsize=(15, 5))
@@ -0,0 +1,231 @@
+# This module contains generators for synthetic data in the exact formats of the RKI csv sources expected by
+# data_preprocess.data_load, so that the pipeline can be run and benchmarked without the real data
+
+import os
+import numpy as np
+import pandas as pd
+
+STATES = ['Schleswig-Holstein', 'Hamburg', 'Niedersachsen', 'Bremen', 'Nordrhein-Westfalen', 'Hessen',
+          'Rheinland-Pfalz', 'Baden-Württemberg', 'Bayern', 'Saarland', 'Berlin', 'Brandenburg',
+          'Mecklenburg-Vorpommern', 'Sachsen', 'Sachsen-Anhalt', 'Thüringen']
+AGE_GROUPS_RKI = ['A00-A04', 'A05-A14', 'A15-A34', 'A35-A59', 'A60-A79', 'A80+', 'unbekannt']
+AGE_GROUPS_5Y = ['0 - 4', '5-9', '10-14', '15 - 19', '20 - 24', '25 - 29', '30 - 34', '35 - 39', '40 - 44', '45 - 49',
+                 '50 - 54', '55 - 59', '60 - 64', '65 - 69', '70 - 74', '75 - 79', '80 - 84', '85 - 89', '90+']
+SETTINGS = [('Arbeitsplatz', 'Work place'), ('Privater Haushalt', 'Private household'),
+            ('Alten-/Pflegeheim', 'Nursing home'), ('Krankenhaus', 'Hospital'), ('Schule', 'School'),
+            ('Kita/Hort', 'Kindergarten'), ('Speisestätte', 'Dining venue'), ('Freizeit', 'Leisure'),
+            ('Unbekannt', 'Unknown')]
+# calendar weeks of 2020 covered by the weekly tables
+WEEKS = list(range(10, 54))
+
+def german_decimals(values, decimals=1):
+    '''
+    formats numbers as strings with decimal comma
+    :param values: numpy array of numbers
+    :param decimals: number of decimals
+    :return: numpy array of strings
+    '''
+    return np.char.replace(np.round(values, decimals).astype('str'), '.', ',').astype(object)
+
+def generate_overview(path, n_rows=100000, n_districts=400, seed=0, chunksize=1000000):
+    '''
+    writes a synthetic RKI_COVID19.csv (dashboard dump with one row per group of cases), written in chunks so that
+    dumps larger than memory can be generated
+    :param path: target file path
+    :param n_rows: number of rows
+    :param n_districts: number of districts (spread over the federal states)
+    :param seed: random seed
+    :param chunksize: number of rows generated and written at once
+    '''
+    rng = np.random.default_rng(seed)
+    days = pd.date_range('2020-01-01', '2021-01-27')
+    day_strings = days.strftime('%Y/%m/%d %H:%M:%S').values
+    # more reports in spring and in winter
+    weights = 1 + 5 * np.exp(-((np.arange(len(days)) - 90) / 20) ** 2) \
+        + 20 * np.exp(-((np.arange(len(days)) - 360) / 40) ** 2)
+    weights /= weights.sum()
+    district_states = np.arange(n_districts) % len(STATES)
+    district_ids = (district_states + 1) * 1000 + np.arange(n_districts) // len(STATES) + 1
+    district_names = np.array([f'LK District {district}' for district in range(n_districts)], dtype=object)
+
+    columns = ['ObjectId', 'IdBundesland', 'Bundesland', 'Landkreis', 'Altersgruppe', 'Geschlecht', 'AnzahlFall',
+               'AnzahlTodesfall', 'Meldedatum', 'IdLandkreis', 'Datenstand', 'NeuerFall', 'NeuerTodesfall',
+               'Refdatum', 'NeuGenesen', 'AnzahlGenesen', 'IstErkrankungsbeginn', 'Altersgruppe2']
+    for start in range(0, n_rows, chunksize):
+        n = min(chunksize, n_rows - start)
+        district = rng.integers(0, n_districts, n)
+        report = rng.choice(len(days), n, p=weights)
+        delay = np.minimum(rng.geometric(0.25, n) - 1, report)
+        cases = rng.geometric(0.6, n)
+        chunk = pd.DataFrame({'ObjectId': np.arange(start, start + n) + 1,
+                              'IdBundesland': district_states[district] + 1,
+                              'Bundesland': np.array(STATES, dtype=object)[district_states[district]],
+                              'Landkreis': district_names[district],
+                              'Altersgruppe': np.array(AGE_GROUPS_RKI, dtype=object)[rng.integers(0, 7, n)],
+                              'Geschlecht': np.array(['M', 'W', 'unbekannt'], dtype=object)[rng.choice(3, n, p=[0.49, 0.5, 0.01])],
+                              'AnzahlFall': cases,
+                              'AnzahlTodesfall': rng.binomial(cases, 0.02),
+                              'Meldedatum': day_strings[report],
+                              'IdLandkreis': district_ids[district],
+                              'Datenstand': '28.01.2021, 00:00 Uhr',
+                              'NeuerFall': 0,
+                              'NeuerTodesfall': -9,
+                              'Refdatum': day_strings[report - delay],
+                              'NeuGenesen': 0,
+                              'AnzahlGenesen': cases,
+                              'IstErkrankungsbeginn': rng.integers(0, 2, n),
+                              'Altersgruppe2': 'Nicht übermittelt'}, columns=columns)
+        chunk.to_csv(path, index=False, mode='w' if start == 0 else 'a', header=start == 0)
+
+def generate_nowcasting(path, n_days=330, seed=0):
+    '''
+    writes a synthetic Nowcasting_Zahlen_csv.csv (semicolon separated, decimal commas, '.' for missing R values)
+    :param path: target file path
+    :param n_days: number of days (data_clean keeps the first 319)
+    :param seed: random seed
+    '''
+    rng = np.random.default_rng(seed)
+    cases = rng.integers(0, 30000, n_days)
+    table = {'Datum': pd.date_range('2020-03-02', periods=n_days).strftime('%d.%m.%Y')}
+    for prefix in ['Schätzer', 'UG_PI', 'OG_PI']:
+        table[f'{prefix}_Neuerkrankungen'] = cases
+    for prefix in ['Schätzer', 'UG_PI', 'OG_PI']:
+        table[f'{prefix}_Neuerkrankungen_ma4'] = cases
+    for name in ['Reproduktionszahl_R', '7_Tage_R_Wert']:
+        for prefix in ['Schätzer', 'UG_PI', 'OG_PI']:
+            values = german_decimals(rng.uniform(0.5, 2, n_days), 2)
+            # R values need a few days of history
+            values[:4 if name == 'Reproduktionszahl_R' else 7] = '.'
+            table[f'{prefix}_{name}'] = values
+    pd.DataFrame(table).to_csv(path, sep=';', index=False)
+
+def generate_breakouts(path, seed=0):
+    '''
+    writes a synthetic Ausbruchsdaten.csv (breakouts per report week and infection setting)
+    :param path: target file path
+    :param seed: random seed
+    '''
+    rng = np.random.default_rng(seed)
+    rows = [(setting, setting_engl, week, rng.integers(0, 500)) for week in range(9, 54)
+            for setting, setting_engl in SETTINGS]
+    pd.DataFrame(rows, columns=['sett_f', 'sett_engl', 'Meldewoche', 'n']).to_csv(path, sep=';', index=False)
+
+def generate_cases_age(path_total, path_incidence, seed=0):
+    '''
+    writes synthetic Altersverteilung_total.csv and Altersverteilung_incidence.csv (weekly cases and incidences per
+    5-year age group, incidences with decimal commas)
+    :param path_total: target file path for the total cases
+    :param path_incidence: target file path for the incidences
+    :param seed: random seed
+    '''
+    rng = np.random.default_rng(seed)
+    weeks = [f'2020_{week}' for week in WEEKS] + ['2021_1']
+    total = rng.integers(0, 20000, (len(AGE_GROUPS_5Y), len(weeks)))
+    incidence = rng.uniform(0, 400, (len(AGE_GROUPS_5Y), len(weeks)))
+
+    total = pd.DataFrame(np.vstack([total.sum(axis=0), total]), columns=weeks)
+    total.insert(0, 'Altersgruppe', ['Gesamt'] + AGE_GROUPS_5Y)
+    total.to_csv(path_total, sep=';', index=False)
+
+    incidence = pd.DataFrame(german_decimals(np.vstack([incidence.mean(axis=0), incidence])), columns=weeks)
+    incidence.insert(0, 'Altersgruppe', ['Gesamt'] + AGE_GROUPS_5Y)
+    incidence.to_csv(path_incidence, sep=';', index=False)
+
+def generate_deaths(path_all, path_age, path_gender, seed=0):
+    '''
+    writes synthetic COVID-19_Todesfaelle_all/age/gender.csv (weekly deaths, small counts given as '<4')
+    :param path_all: target file path for all deaths
+    :param path_age: target file path for deaths per age group
+    :param path_gender: target file path for deaths per age group and sex
+    :param seed: random seed
+    '''
+    rng = np.random.default_rng(seed)
+
+    def counts():
+        values = rng.integers(0, 1000, len(WEEKS)).astype(object)
+        values[values < 4] = '<4'
+        return values
+
+    pd.DataFrame({'Sterbejahr': 2020, 'Sterbewoche': WEEKS, 'Anzahl verstorbene COVID-19 Fälle': counts()}) \
+        .to_csv(path_all, sep=';', index=False)
+
+    age = {'Sterbjahr': 2020, 'Sterbewoche': WEEKS}
+    age.update({f'AG {group}-{group + 9} Jahre': counts() for group in range(0, 90, 10)})
+    age['AG 90+ Jahre'] = counts()
+    pd.DataFrame(age).to_csv(path_age, sep=';', index=False)
+
+    gender = {'Sterbjahr': 2020, 'Sterbewoche': WEEKS}
+    for sex in ['Männer', 'Frauen']:
+        gender.update({f'{sex}, AG {group} Jahre': counts() for group in ['0-19', '20-39', '40-59', '60-79', '80+']})
+    pd.DataFrame(gender).to_csv(path_gender, sep=';', index=False)
+
+def generate_tests(path_total, path_tailback, seed=0):
+    '''
+    writes synthetic Testzahlen-gesamt.csv ('KW..' week strings, '-' for unknown capacities) and
+    Testzahlen-rueck.csv (with a trailing separator)
+    :param path_total: target file path for the test capacities
+    :param path_tailback: target file path for the test tailbacks
+    :param seed: random seed
+    '''
+    rng = np.random.default_rng(seed)
+    weeks = list(range(11, 54)) + [1, 2]
+    capacity = rng.integers(10 ** 5, 2 * 10 ** 6, len(weeks)).astype(object)
+    real = rng.integers(10 ** 5, 2 * 10 ** 6, len(weeks)).astype(object)
+    capacity[:2], real[:3] = '-', '-'
+    pd.DataFrame({'KW, für die die Angabe prognostisch erfolgt ist:': [f'KW{week}' for week in weeks],
+                  'Anzahl übermittelnde Labore': rng.integers(50, 200, len(weeks)),
+                  'Testkapazität pro Tag': rng.integers(10 ** 4, 3 * 10 ** 5, len(weeks)),
+                  'Theoretische wöchentliche Kapazität anhand von Wochenarbeitstagen': capacity,
+                  'Reale Testkapazität zum Zeitpunkt der Abfrage': real}).to_csv(path_total, sep=';', index=False)
+
+    with open(path_tailback, 'w') as file:
+        file.write('Labore mit Rückstau;KW;Probenrückstau;\n')
+        for week in range(15, 54):
+            file.write(f'{rng.integers(0, 100)};{week};{rng.integers(0, 10 ** 5)};\n')
+
+def generate_clinical(path, seed=0):
+    '''
+    writes a synthetic Klinische_Aspekte.csv (two lines of preamble, leading separator, shares with decimal commas)
+    :param path: target file path
+    :param seed: random seed
+    '''
+    rng = np.random.default_rng(seed)
+    n = len(WEEKS)
+    cases = rng.integers(100, 10 ** 5, n)
+    table = pd.DataFrame({'Meldejahr': 2020,
+                          'MW': WEEKS,
+                          'Fälle gesamt': cases,
+                          'Mittelwert Alter (Jahre)': rng.integers(30, 60, n),
+                          'Männer': german_decimals(rng.uniform(0.4, 0.6, n), 3),
+                          'Frauen': german_decimals(rng.uniform(0.4, 0.6, n), 3),
+                          'Anzahl mit Angaben zu Symptomen': (cases * 0.8).astype('int'),
+                          'Anteil keine, bzw. keine für COVID-19 bedeutsamen Symptome': german_decimals(rng.uniform(0, 0.3, n), 3),
+                          'Anzahl mit Angaben zur Hospitalisierung': (cases * 0.7).astype('int'),
+                          'Anzahl hospitalisiert': (cases * 0.1).astype('int'),
+                          'Anteil hospitalisiert': german_decimals(rng.uniform(0, 0.2, n), 3),
+                          'Anzahl Verstorben': (cases * 0.02).astype('int'),
+                          'Anteil Verstorben': german_decimals(rng.uniform(0, 0.05, n), 3)})
+    table.insert(0, '', '')
+    with open(path, 'w') as file:
+        file.write('Klinische Aspekte (synthetic)\nStand: 2021-01-28\n')
+        table.to_csv(file, sep=';', index=False)
+
+def generate_all(root='.', n_rows=100000, seed=0):
+    '''
+    writes all csv sources of data_preprocess.SOURCES below root/data/RKI
+    :param root: directory that takes the place of the project directory
+    :param n_rows: number of rows of the RKI dump
+    :param seed: random seed
+    '''
+    directory = os.path.join(root, 'data', 'RKI')
+    os.makedirs(directory, exist_ok=True)
+    path = lambda filename: os.path.join(directory, filename)
+
+    generate_overview(path('RKI_COVID19.csv'), n_rows=n_rows, seed=seed)
+    generate_nowcasting(path('Nowcasting_Zahlen_csv.csv'), seed=seed)
+    generate_breakouts(path('Ausbruchsdaten.csv'), seed=seed)
+    generate_cases_age(path('Altersverteilung_total.csv'), path('Altersverteilung_incidence.csv'), seed=seed)
+    generate_deaths(path('COVID-19_Todesfaelle_all.csv'), path('COVID-19_Todesfaelle_age.csv'),
+                    path('COVID-19_Todesfaelle_gender.csv'), seed=seed)
+    generate_tests(path('Testzahlen-gesamt.csv'), path('Testzahlen-rueck.csv'), seed=seed)
+    generate_clinical(path('Klinische_Aspekte.csv'), seed=seed)
@@ -0,0 +1,168 @@
+# This module contains functions for daily time series of the cleaned case overview: 7-day incidences, 4-day and
+# 7-day R estimates and nowcasts corrected for the reporting delay, computed for all regions (federal states or
+# districts) at once on arrays with one row per region and one column per day
+
+import numpy as np
+import pandas as pd
+
+def region_codes(overview, by=None):
+    '''
+    integer codes of the regions of the case records
+    :param overview: cleaned overview
+    :param by: column (e.g. 'Bundesland') or list of columns (e.g. ['Bundesland', 'Landkreis'], as district names
+    are not unique) identifying a region; None for Germany as a whole
+    :return: numpy array of region codes per record, pandas index of the (sorted) regions
+    '''
+    if by is None:
+        return np.zeros(len(overview), dtype='int64'), pd.Index(['Deutschland'])
+    if isinstance(by, str):
+        codes, regions = pd.factorize(overview[by], sort=True)
+        return codes, pd.Index(regions, name=by)
+
+    # combine the codes of the single columns, keeping only combinations that occur
+    factorized = [pd.factorize(overview[col], sort=True) for col in by]
+    combined = np.ravel_multi_index([codes for codes, _ in factorized], [len(labels) for _, labels in factorized])
+    used, codes = np.unique(combined, return_inverse=True)
+    levels = np.unravel_index(used, [len(labels) for _, labels in factorized])
+    regions = pd.MultiIndex.from_arrays([np.asarray(labels)[level] for (_, labels), level in zip(factorized, levels)],
+                                        names=by)
+    return codes, regions
+
+def daily_counts(overview, by=None, date='ref_date', measure='AnzahlFall', start=None, end=None):
+    '''
+    sums a measure of the cleaned overview per region and day, without gaps in the date axis; records without a date
+    (NaT) are left out
+    :param overview: cleaned overview (see data_preprocess.clean_overview)
+    :param by: column or list of columns identifying a region (see region_codes)
+    :param date: 'ref_date' (reference date) or 'report_date' (report date)
+    :param measure: column to sum, e.g. 'AnzahlFall' or 'AnzahlTodesfall'
+    :param start: first day of the date axis (default: first date in the data)
+    :param end: last day of the date axis (default: last date in the data)
+    :return: pandas dataframe with regions as index and days as columns
+    '''
+    days = overview[date].values.astype('datetime64[D]')
+    dated = ~np.isnat(days)
+    start = np.datetime64(start, 'D') if start is not None else days[dated].min()
+    end = np.datetime64(end, 'D') if end is not None else days[dated].max()
+    n_days = int((end - start).astype('int64')) + 1
+    day_codes = np.where(dated, days - start, -1).astype('int64')
+
+    codes, regions = region_codes(overview, by)
+
+    # missing days and days outside of the date axis are left out
+    inside = (day_codes >= 0) & (day_codes < n_days)
+    counts = np.bincount(codes[inside] * n_days + day_codes[inside],
+                         weights=overview[measure].values[inside], minlength=len(regions) * n_days)
+    return pd.DataFrame(counts.reshape(len(regions), n_days).astype('int64'), index=regions,
+                        columns=pd.date_range(start, periods=n_days, freq='D', name=date))
+
+def rolling_sum(values, window):
+    '''
+    sums over the last window days along the last axis via cumulative sums, i.e. in O(n) for any window length
+    :param values: numpy array (any number of rows, days along the last axis)
+    :param window: number of days
+    :return: float numpy array of the same shape, NaN for the first window - 1 days (all NaN if there are fewer
+    days than window)
+    '''
+    values = np.asarray(values, dtype='float64')
+    sums = np.full(values.shape, np.nan)
+    if values.shape[-1] < window:
+        return sums
+    cumsum = np.cumsum(values, axis=-1)
+    sums[..., window - 1] = cumsum[..., window - 1]
+    sums[..., window:] = cumsum[..., window:] - cumsum[..., :-window]
+    return sums
+
+def incidence(cases, population, window=7):
+    '''
+    daily incidence: cases of the last window days per 100.000 inhabitants
+    :param cases: pandas dataframe of daily cases with regions as index and days as columns (see daily_counts)
+    :param population: pandas series with the population per region (number of inhabitants)
+    :param window: number of days
+    :return: pandas dataframe with regions as index and days as columns
+    '''
+    sums = rolling_sum(cases.values, window)
+    return pd.DataFrame(sums / population.reindex(cases.index).values[:, None] * 100000,
+                        index=cases.index, columns=cases.columns)
+
+def reproduction_number(cases, window=4, interval=4):
+    '''
+    R estimate as in the RKI nowcasting: cases of the last window days divided by the cases of the window days
+    interval days earlier (4-day R: window=4, 7-day R: window=7, both with the generation time of 4 days)
+    :param cases: pandas dataframe of daily cases (ideally by reference date and delay corrected, see nowcast) with
+    regions as index and days as columns
+    :param window: number of days that are summed
+    :param interval: generation time in days
+    :return: pandas dataframe with regions as index and days as columns, NaN where no cases are in the earlier window
+    '''
+    sums = rolling_sum(cases.values, window)
+    earlier = np.full(sums.shape, np.nan)
+    earlier[:, interval:] = sums[:, :-interval]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = np.where(earlier > 0, sums / earlier, np.nan)
+    return pd.DataFrame(r, index=cases.index, columns=cases.columns)
+
+def delay_distribution(overview, by=None, max_delay=28, measure='AnzahlFall'):
+    '''
+    distribution of the reporting delay (days from reference date to report date); only cases with a reference date
+    at least max_delay days before the last report date are used, as later ones are not completely reported yet;
+    cases without report or reference date are left out
+    :param overview: cleaned overview
+    :param by: column or list of columns identifying a region (see region_codes); None for one distribution
+    :param max_delay: longest delay; longer delays are counted as max_delay, negative ones as 0
+    :param measure: column to weight the cases with
+    :return: pandas dataframe with regions as index and delays 0..max_delay as columns (rows sum up to 1)
+    '''
+    codes, regions = region_codes(overview, by)
+    report = overview['report_date'].values.astype('datetime64[D]')
+    last = report[~np.isnat(report)].max()
+    # comparisons with NaT are False
+    complete = (overview['ref_date'].values.astype('datetime64[D]') <= last - max_delay) & ~np.isnat(report)
+    delays = np.clip(overview['report_delay'].values[complete].astype('int64'), 0, max_delay)
+
+    counts = np.bincount(codes[complete] * (max_delay + 1) + delays, weights=overview[measure].values[complete],
+                         minlength=len(regions) * (max_delay + 1)).reshape(len(regions), max_delay + 1)
+    pmf = counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    return pd.DataFrame(pmf, index=regions, columns=pd.RangeIndex(max_delay + 1, name='delay'))
+
+def expected_reports(cases, pmf):
+    '''
+    convolves daily cases by reference date with the delay distribution, i.e. the number of cases expected to be
+    reported per day
+    :param cases: pandas dataframe of daily cases by reference date with regions as index and days as columns
+    :param pmf: delay distribution (see delay_distribution), one row for all regions or one row per region
+    :return: pandas dataframe of expected reports with regions as index and days as columns
+    '''
+    values = cases.values.astype('float64')
+    weights = pmf.values if len(pmf) == 1 else pmf.reindex(cases.index).values
+    reports = np.zeros(values.shape)
+    # loop over the delays only, all regions and days at once
+    for delay in range(min(weights.shape[1], values.shape[1])):
+        reports[:, delay:] += values[:, :values.shape[1] - delay] * weights[:, delay:delay + 1]
+    return pd.DataFrame(reports, index=cases.index, columns=cases.columns)
+
+def nowcast(overview, by=None, max_delay=28, min_reported=0.2, measure='AnzahlFall'):
+    '''
+    corrects the daily cases by reference date for cases that are not reported yet: the cases of every day are
+    divided by the share of cases that is reported within the days between that day and the last report date
+    :param overview: cleaned overview
+    :param by: column or list of columns identifying a region (see region_codes)
+    :param max_delay: longest delay of the delay distribution
+    :param min_reported: days whose expected reported share is lower are left out (NaN), as the correction gets
+    unreliable
+    :param measure: column to sum
+    :return: pandas dataframe of delay corrected cases with regions as index and days as columns (up to the last
+    report date); cases without report or reference date are left out
+    '''
+    report = overview['report_date'].values
+    last = report[~np.isnat(report)].max()
+    observed = daily_counts(overview, by=by, date='ref_date', measure=measure, end=last)
+    pmf = delay_distribution(overview, by=by, max_delay=max_delay, measure=measure)
+    cdf = np.cumsum(pmf.values if len(pmf) == 1 else pmf.reindex(observed.index).fillna(0).values, axis=1)
+
+    # days between every reference date and the last report date, capped at the longest delay
+    elapsed = np.minimum(np.arange(observed.shape[1])[::-1], max_delay)
+    reported = cdf[:, elapsed]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corrected = np.where(reported >= min_reported, observed.values / reported, np.nan)
+    return pd.DataFrame(corrected, index=observed.index, columns=observed.columns)